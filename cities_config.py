@@ -4,6 +4,8 @@
 import os
 from typing import Dict, List, Optional
 
+from zone_matcher import ZoneIndex
+
 class CityConfig:
     def __init__(self, 
                  name: str,
@@ -12,7 +14,8 @@ class CityConfig:
                  macro_zones: List[str],
                  zone_mapping: Dict[str, List[str]],
                  data_file: str = None,
-                 rss_urls: List[str] = None):
+                 rss_urls: List[str] = None,
+                 languages: List[str] = None):
         self.name = name
         self.display_name = display_name
         self.notion_database_id = notion_database_id
@@ -21,6 +24,16 @@ class CityConfig:
         self.data_file = data_file or f"public/data_{name}.json"
         self.cache_file = f"rejected_urls_cache_{name}.json"
         self.rss_urls = rss_urls or []
+        # Lingue dei post nei feed (regole del prefiltro di rilevanza)
+        self.languages = languages or ["en"]
+        self._zone_index = None
+
+    @property
+    def zone_index(self) -> ZoneIndex:
+        """Indice normalizzato dello zone_mapping, compilato al primo utilizzo"""
+        if self._zone_index is None:
+            self._zone_index = ZoneIndex(self.zone_mapping)
+        return self._zone_index
     
     def get_rss_urls(self) -> List[str]:
         """Restituisce tutti i feed RSS disponibili per questa città"""
@@ -50,6 +63,7 @@ CITIES = {
             "L'Hospitalet de Llobregat"
         ],
         rss_urls=[],  # I feed RSS vengono caricati dinamicamente da get_rss_urls()
+        languages=["es", "ca", "en"],
         zone_mapping={
             "Ciutat Vella": [
                 "ciutat vella", "barri gotic", "el gotic", "gotic", "el born", "born",
@@ -116,6 +130,7 @@ CITIES = {
             "Ardeatino", "Appio Latino", "Tuscolano", "Colli Albani", "Eur"
         ],
         rss_urls=[],  # I feed RSS vengono caricati dinamicamente da get_rss_urls()
+        languages=["it", "en"],
         zone_mapping={
             "Centro Storico": [
                 "centro storico", "piazza navona", "campo de fiori", "pantheon", "piazza venezia",
@@ -195,6 +210,7 @@ CITIES = {
             "Brent", "Ealing", "Hounslow", "Hillingdon"
         ],
         rss_urls=[],  # I feed RSS vengono caricati dinamicamente da get_rss_urls()
+        languages=["en"],
         zone_mapping={
             "Central London": [
                 "central london", "soho", "covent garden", "leicester square", "piccadilly circus",
@@ -345,7 +361,7 @@ CITIES = {
             ],
             "Hillingdon": [
                 "hillingdon", "uxbridge", "hayes", "west drayton", "yiewsley",
-                "cowley", "hillingdon", "ruislip", "eastcote", "northwood"
+                "cowley", "ruislip", "eastcote", "northwood"
             ]
         }
     )
@@ -390,6 +406,12 @@ def get_zone_mapping_for_city(city_name: str = None) -> Dict[str, List[str]]:
     config = get_city_config(city)
     return config.zone_mapping if config else {}
 
+def get_zone_index_for_city(city_name: str = None) -> ZoneIndex:
+    """Restituisce l'indice delle zone per una città specifica"""
+    city = city_name or get_current_city()
+    config = get_city_config(city)
+    return config.zone_index if config else ZoneIndex({})
+
 def get_rss_urls_for_city(city_name: str = None) -> List[str]:
     """Restituisce i feed RSS per una città specifica"""
     city = city_name or get_current_city()
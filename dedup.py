@@ -0,0 +1,646 @@
+# dedup.py
+# Strutture di supporto per la deduplicazione degli annunci
+
+import hashlib
+import json
+import math
+import os
+import re
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from json_store import save_json_atomic
+from lru_cache import content_key
+
+
+# Chiave di blocking: (macro-zona, fascia di prezzo), None = sconosciuto
+BlockKey = Tuple[Optional[str], Optional[int]]
+
+# Testi normalizzati più corti di così non sono mai considerati duplicati ("vedi foto", "info in dm")
+MIN_TEXT_CHARS = 10
+
+# Fasce di prezzo geometriche larghe il 15%; i prezzi fuori da questo intervallo sono considerati non validi
+PRICE_BAND_RATIO = 1.15
+MIN_VALID_PRICE = 50
+MAX_VALID_PRICE = 20000
+_PRICE_PATTERN = re.compile(r"(\d{1,3}(?:[.,' ]\d{3})+|\d+)(?:[.,]\d{1,2})?(?!\d)")
+
+
+def parse_price(text: str) -> Optional[float]:
+    """Primo importo plausibile in un campo prezzo ("€1.200/month", "450 EUR", "N/A" → None)."""
+    if not text:
+        return None
+    for match in _PRICE_PATTERN.finditer(text):
+        value = float(re.sub(r"[.,' ]", "", match.group(1)))
+        if MIN_VALID_PRICE <= value <= MAX_VALID_PRICE:
+            return value
+    return None
+
+
+def price_band(text: str) -> Optional[int]:
+    """Fascia di prezzo (logaritmica) per il blocking, None se il prezzo non è interpretabile."""
+    return band_for_price(parse_price(text))
+
+
+def band_for_price(price: Optional[float]) -> Optional[int]:
+    """Fascia di prezzo di un importo già interpretato (vedi parse_price)."""
+    if price is None:
+        return None
+    return int(math.floor(math.log(price) / math.log(PRICE_BAND_RATIO)))
+
+
+def tokenize(normalized: str) -> List[str]:
+    """Token unici e ordinati di un testo già normalizzato."""
+    return sorted(set(normalized.split()))
+
+
+def _discard(buckets: dict, key, page_id: str):
+    """Toglie la pagina dal bucket e cancella il bucket rimasto vuoto."""
+    ids = buckets.get(key)
+    if ids is not None:
+        ids.discard(page_id)
+        if not ids:
+            del buckets[key]
+
+
+@dataclass
+class ListingFeatures:
+    """Campi derivati di un annuncio, calcolati una sola volta per post (vedi main.enrich_listing).
+
+    `fingerprint` è l'impronta di FingerprintIndex.fingerprint (None se le impronte sono
+    disattivate o il testo è troppo corto), `price` il prezzo interpretato da parse_price.
+    """
+    normalized_desc: str
+    tokens: List[str]
+    fingerprint: Optional[Tuple[bytes, int]] = None
+    price: Optional[float] = None
+    zone_macro: str = ""
+    zone_matched: str = ""
+
+    @property
+    def block_key(self) -> BlockKey:
+        return self.zone_macro or None, band_for_price(self.price)
+
+
+def similarity_matrix(queries: List[str], choices: List[str]) -> np.ndarray:
+    """Matrice (len(queries) × len(choices)) di similarità tra testi già normalizzati.
+
+    token_set_ratio calcolato da rapidfuzz su tutti i core, bonus del 5% se le lunghezze
+    differiscono meno del 10% e punteggio 0 per testi più corti di 10 caratteri.
+    """
+    if not queries or not choices:
+        return np.zeros((len(queries), len(choices)), dtype=np.float32)
+    scores = process.cdist(queries, choices, scorer=fuzz.token_set_ratio,
+                           dtype=np.float32, workers=-1) / 100.0
+    query_len = np.array([len(q) for q in queries], dtype=np.float32)[:, None]
+    choice_len = np.array([len(c) for c in choices], dtype=np.float32)[None, :]
+    length_diff = np.abs(query_len - choice_len) / np.maximum(np.maximum(query_len, choice_len), 1)
+    scores = np.where(length_diff < 0.1, np.minimum(scores + 0.05, 1.0), scores)
+    scores[(query_len < MIN_TEXT_CHARS) | (choice_len < MIN_TEXT_CHARS)] = 0.0
+    return scores
+
+
+def pick_best_matches(scores: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Per ogni riga: prima colonna sopra la soglia (le colonne sono ordinate per priorità),
+    altrimenti la colonna con punteggio massimo. Ritorna (indici, punteggi)."""
+    above = scores >= threshold
+    best_idx = np.where(above.any(axis=1), above.argmax(axis=1), scores.argmax(axis=1))
+    return best_idx, scores[np.arange(scores.shape[0]), best_idx]
+
+
+class DescriptionMemo:
+    """Memo persistente tra i run: hash del contenuto → (testo normalizzato, token).
+
+    La chiave è l'hash della descrizione originale e non `last_edited_time`, che
+    cambia anche per i semplici aggiornamenti di status. Al salvataggio vengono
+    mantenute solo le voci usate nel run corrente, così il file segue il database.
+    """
+
+    def __init__(self, path: str, normalize: Callable[[str], str]):
+        self.path = path
+        self.normalize = normalize
+        self._entries: Dict[str, dict] = {}
+        self._used = set()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f).get('entries', {})
+            except Exception as e:
+                print(f"⚠️ Dedup memo loading error: {e}")
+                self._entries = {}
+        return self
+
+    def get(self, text: str) -> Tuple[str, List[str]]:
+        """Restituisce (testo normalizzato, token) calcolandoli solo se il contenuto è nuovo."""
+        key = content_key(text).hex()
+        self._used.add(key)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry['norm'], entry['tokens']
+        self.misses += 1
+        normalized = self.normalize(text)
+        tokens = tokenize(normalized)
+        self._entries[key] = {'norm': normalized, 'tokens': tokens}
+        self._dirty = True
+        return normalized, tokens
+
+    def prepare_pages(self, pages: List[dict]):
+        """Aggiunge `_normalized_desc` e `_tokens` a ogni pagina (una sola volta per pagina)."""
+        for page in pages:
+            if "_normalized_desc" in page:
+                continue
+            page["_normalized_desc"], page["_tokens"] = self.get(page.get("original_description", ""))
+
+    def save(self):
+        """Salva il memo (scrittura atomica) mantenendo solo le voci usate in questo run."""
+        if not self._used:
+            # Run interrotto prima della deduplicazione: non sovrascrivere il memo
+            return
+        stale = set(self._entries) - self._used
+        if not self._dirty and not stale:
+            return
+        for key in stale:
+            del self._entries[key]
+        if save_json_atomic(self.path, {'entries': self._entries}, "Dedup memo", separators=(",", ":")):
+            self._dirty = False
+
+    def describe(self) -> str:
+        return f"Dedup memo: {len(self._entries)} entries, {self.hits} reused, {self.misses} normalized"
+
+
+class MinHashLSHIndex:
+    """Indice LSH (MinHash sui token) per trovare i candidati duplicati senza scansione lineare.
+
+    Con 32 bande da 2 righe la soglia di Jaccard è ~0.18: coppie con Jaccard 0.3
+    diventano candidate con probabilità ~95%, quelle sopra 0.5 praticamente sempre.
+    I candidati vanno poi verificati con `similarity_matrix`.
+
+    Le garanzie della Jaccard non coprono token_set_ratio, che dà 1.0 quando un testo
+    contiene tutti i token di uno più corto (ripubblicazione accorciata). Se A ⊆ B la
+    Jaccard è |A|/|B|: finché i due insiemi di token differiscono per dimensione meno
+    di `size_ratio` (3×, Jaccard ≥ 0.33) le bande bastano, oltre non danno garanzie.
+    Per questo `query` aggiunge sempre ai candidati le pagine di dimensione fuori da
+    quell'intervallo, che nel caso tipico sono poche. La recall residua si misura con
+    DEDUP_RECALL_CHECK.
+    """
+
+    _PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 32, seed: int = 1, size_ratio: float = 3.0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self._PRIME, size=(num_perm, 1), dtype=np.int64)
+        self._b = rng.integers(0, self._PRIME, size=(num_perm, 1), dtype=np.int64)
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(bands)]
+        self._band_keys: Dict[str, List[bytes]] = {}
+        self._pages: Dict[str, dict] = {}
+        # Pagine per numero di token distinti, per i candidati per contenimento
+        self.size_ratio = size_ratio
+        self._size_of: Dict[str, int] = {}
+        self._by_size: Dict[int, set] = {}
+        self.queries = 0
+        self.candidates_returned = 0
+        self.size_candidates = 0
+
+    def signature(self, tokens: List[str]) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.int64, count=len(tokens))
+        return ((self._a * hashes + self._b) % self._PRIME).min(axis=1)
+
+    def _band_keys_for(self, tokens: List[str]) -> List[bytes]:
+        signature = self.signature(tokens)
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, page: dict):
+        """Indicizza una pagina (serve `_tokens`, vedi DescriptionMemo.prepare_pages)."""
+        page_id = page.get("id")
+        tokens = page.get("_tokens")
+        if not page_id or not tokens:
+            return
+        if page_id in self._band_keys:
+            self.remove(page_id)
+        band_keys = self._band_keys_for(tokens)
+        for bucket, key in zip(self._buckets, band_keys):
+            bucket.setdefault(key, set()).add(page_id)
+        self._band_keys[page_id] = band_keys
+        self._pages[page_id] = page
+        size = len(set(tokens))
+        self._size_of[page_id] = size
+        self._by_size.setdefault(size, set()).add(page_id)
+
+    def remove(self, page_id: str):
+        band_keys = self._band_keys.pop(page_id, None)
+        self._pages.pop(page_id, None)
+        if band_keys is None:
+            return
+        _discard(self._by_size, self._size_of.pop(page_id), page_id)
+        for bucket, key in zip(self._buckets, band_keys):
+            _discard(bucket, key, page_id)
+
+    def query(self, tokens: List[str]) -> List[dict]:
+        """Pagine che condividono almeno una banda con i token dati, più quelle di dimensione
+        troppo diversa perché le bande ne garantiscano la recall (vedi la docstring della classe)."""
+        self.queries += 1
+        if not tokens:
+            return []
+        candidate_ids = set()
+        for bucket, key in zip(self._buckets, self._band_keys_for(tokens)):
+            ids = bucket.get(key)
+            if ids:
+                candidate_ids.update(ids)
+        size = len(set(tokens))
+        for page_size, ids in self._by_size.items():
+            if page_size * self.size_ratio < size or page_size > size * self.size_ratio:
+                self.size_candidates += len(ids)
+                candidate_ids.update(ids)
+        self.candidates_returned += len(candidate_ids)
+        return [self._pages[page_id] for page_id in candidate_ids]
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def describe(self) -> str:
+        avg = self.candidates_returned / self.queries if self.queries else 0.0
+        by_size = self.size_candidates / self.queries if self.queries else 0.0
+        return (f"LSH index: {len(self._pages)} pages, {self.queries} queries, {avg:.1f} candidates/query "
+                f"({by_size:.1f} by token-count ratio)")
+
+
+def simhash64(tokens: List[str]) -> int:
+    """SimHash a 64 bit dei token (ogni token pesa 1): testi quasi identici differiscono in pochi bit."""
+    if not tokens:
+        return 0
+    digests = b"".join(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest() for t in tokens)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(tokens), 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int32) * 2 - len(tokens)
+    return int.from_bytes(np.packbits(votes > 0, bitorder="little").tobytes(), "little")
+
+
+class FingerprintIndex:
+    """Impronte esatte e quasi esatte delle descrizioni, consultate prima del confronto fuzzy.
+
+    - hash del testo normalizzato → pagine identiche (ripubblicazioni, spazi diversi), in O(1)
+    - SimHash a 64 bit con tabelle permutate: la firma è divisa in `max_distance + 1`
+      blocchi e per il principio dei cassetti due firme a distanza di Hamming
+      ≤ max_distance coincidono in almeno un blocco, quindi basta una lookup per blocco.
+
+    Testi con meno di `min_tokens` token o di MIN_TEXT_CHARS caratteri non hanno impronte
+    (troppe collisioni, e il confronto fuzzy li considera comunque non duplicati).
+    """
+
+    def __init__(self, max_distance: int = 3, min_tokens: int = 8):
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self._blocks = max_distance + 1
+        self._block_bits = 64 // self._blocks
+        self._exact: Dict[bytes, set] = {}
+        self._tables: List[Dict[int, set]] = [{} for _ in range(self._blocks)]
+        self._entries: Dict[str, Tuple[bytes, int]] = {}
+        self.exact_hits = 0
+        self.simhash_hits = 0
+        self.misses = 0
+
+    def fingerprint(self, normalized: str, tokens: List[str]) -> Optional[Tuple[bytes, int]]:
+        """(hash esatto, SimHash) del testo, None se è troppo corto per averne."""
+        if len(normalized) < MIN_TEXT_CHARS or len(tokens) < self.min_tokens:
+            return None
+        return content_key(normalized), simhash64(tokens)
+
+    def _block_keys(self, simhash: int) -> List[int]:
+        mask = (1 << self._block_bits) - 1
+        return [(simhash >> (i * self._block_bits)) & mask for i in range(self._blocks)]
+
+    def add(self, page: dict):
+        """Indicizza una pagina (servono `_normalized_desc` e `_tokens`, vedi DescriptionMemo.prepare_pages;
+        `_fingerprint`, se presente, evita di ricalcolare l'impronta)."""
+        page_id = page.get("id")
+        normalized = page.get("_normalized_desc")
+        if not page_id or not normalized:
+            return
+        if page_id in self._entries:
+            self.remove(page_id)
+        fingerprint = page.get("_fingerprint") or self.fingerprint(normalized, page.get("_tokens") or [])
+        if fingerprint is None:
+            return
+        exact, simhash = fingerprint
+        self._exact.setdefault(exact, set()).add(page_id)
+        for table, key in zip(self._tables, self._block_keys(simhash)):
+            table.setdefault(key, set()).add(page_id)
+        self._entries[page_id] = fingerprint
+
+    def remove(self, page_id: str):
+        entry = self._entries.pop(page_id, None)
+        if entry is None:
+            return
+        exact, simhash = entry
+        _discard(self._exact, exact, page_id)
+        for table, key in zip(self._tables, self._block_keys(simhash)):
+            _discard(table, key, page_id)
+
+
+    def query(self, normalized: str, tokens: List[str],
+              fingerprint: Tuple[bytes, int] = None) -> Tuple[List[str], Dict[str, int]]:
+        """Ritorna (id con testo identico, {id: distanza di Hamming} dei vicini SimHash).
+        `fingerprint` è l'impronta già calcolata del testo, se disponibile; i testi troppo
+        corti non hanno impronta e non trovano nulla."""
+        fingerprint = fingerprint or self.fingerprint(normalized, tokens)
+        if fingerprint is None:
+            self.misses += 1
+            return [], {}
+        exact, simhash = fingerprint
+        exact_ids = list(self._exact.get(exact, ()))
+        near: Dict[str, int] = {}
+        if not exact_ids:
+            for table, key in zip(self._tables, self._block_keys(simhash)):
+                for page_id in table.get(key, ()):
+                    if page_id not in near:
+                        near[page_id] = bin(simhash ^ self._entries[page_id][1]).count("1")
+            near = {page_id: d for page_id, d in near.items() if d <= self.max_distance}
+        if exact_ids:
+            self.exact_hits += 1
+        elif near:
+            self.simhash_hits += 1
+        else:
+            self.misses += 1
+        return exact_ids, near
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def describe(self) -> str:
+        return (f"Fingerprint index: {len(self._entries)} pages, {self.exact_hits} exact hits, "
+                f"{self.simhash_hits} SimHash hits, {self.misses} fuzzy fallthroughs")
+
+
+# Suffissi di dimensione/variante aggiunti dai CDN al nome del file (foo_n.jpg, foo-800x600.jpg, foo@2x.jpg)
+_IMAGE_VARIANT_SUFFIX = re.compile(r"(?:[_-](?:[nosqtb]|\d{2,4}x\d{2,4}|thumb|small|medium|large)|@\dx)$")
+# Immagini condivise da annunci diversi (loghi, avatar, segnaposto)
+_GENERIC_IMAGE_WORDS = ("logo", "avatar", "icon", "placeholder", "default", "emoji", "sprite", "blank")
+
+
+def image_asset_key(url: str) -> Optional[str]:
+    """Chiave dell'asset di un'immagine, stabile tra host CDN, parametri di resize e varianti di dimensione.
+
+    Usa il nome del file senza estensione e suffissi di variante; se è troppo generico
+    (es. "image", "1") ricade su host + percorso. None per URL vuoti o immagini generiche.
+    """
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/").lower()
+    if not path or any(word in path for word in _GENERIC_IMAGE_WORDS):
+        return None
+    name = os.path.splitext(path.rsplit("/", 1)[-1])[0]
+    name = _IMAGE_VARIANT_SUFFIX.sub("", name)
+    if len(name) >= 12 and any(c.isdigit() for c in name):
+        return name
+    return f"{parts.netloc.lower()}{path}"
+
+
+class ImageFingerprintIndex:
+    """Indice inverso chiave asset immagine → pagine: le ripubblicazioni riusano le stesse foto
+    anche quando il testo è stato riscritto.
+
+    Le chiavi presenti in più di `max_pages_per_key` pagine attive sono ignorate
+    (foto di repertorio, immagini dell'agenzia).
+    """
+
+    def __init__(self, max_pages_per_key: int = 3):
+        self.max_pages_per_key = max_pages_per_key
+        self._pages_by_key: Dict[str, set] = {}
+        self._keys_by_page: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def keys_for(urls) -> set:
+        if isinstance(urls, str):
+            urls = [urls]
+        return {key for key in (image_asset_key(url) for url in urls or []) if key}
+
+    def add(self, page: dict):
+        """Indicizza le immagini di una pagina (campo `images`: URL o lista di URL)."""
+        page_id = page.get("id")
+        keys = self.keys_for(page.get("images"))
+        if not page_id or not keys:
+            return
+        if page_id in self._keys_by_page:
+            self.remove(page_id)
+        for key in keys:
+            self._pages_by_key.setdefault(key, set()).add(page_id)
+        self._keys_by_page[page_id] = keys
+
+    def remove(self, page_id: str):
+        for key in self._keys_by_page.pop(page_id, ()):
+            _discard(self._pages_by_key, key, page_id)
+
+    def query(self, urls) -> set:
+        """Id delle pagine che condividono almeno un'immagine (non generica) con gli URL dati."""
+        page_ids = set()
+        for key in self.keys_for(urls):
+            ids = self._pages_by_key.get(key, ())
+            if len(ids) <= self.max_pages_per_key:
+                page_ids.update(ids)
+        if page_ids:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return page_ids
+
+    def __len__(self) -> int:
+        return len(self._keys_by_page)
+
+    def describe(self) -> str:
+        return (f"Image index: {len(self._keys_by_page)} pages, {len(self._pages_by_key)} image keys, "
+                f"{self.hits} hits, {self.misses} misses")
+
+
+class DedupCandidateIndex:
+    """Pagine attive per la deduplicazione, mantenute dalla più recente alla più vecchia.
+
+    Costruito una volta da `get_existing_data`: le nuove pagine vanno in testa in O(1)
+    e le pagine marcate "expired" si rimuovono per id in O(1), tenendo allineati
+    l'eventuale indice LSH e i bucket di blocking. Ogni pagina ha un rank crescente
+    con la recenza, così anche un sottoinsieme di candidati si ordina senza
+    riconfrontare le date.
+
+    Con `fingerprints` le descrizioni identiche o quasi identiche (SimHash) si
+    risolvono senza confronto fuzzy, vedi `fingerprint_match`; con `images` lo
+    stesso vale per i post che riusano le foto di una pagina attiva (`image_match`).
+
+    Con `block_key` (pagina/post → (macro-zona, fascia di prezzo)) le pagine sono
+    divise in bucket e un post viene confrontato solo con il proprio bucket, le
+    fasce di prezzo adiacenti e i bucket con chiave sconosciuta (None).
+    """
+
+    def __init__(self, pages: List[dict] = None, lsh: MinHashLSHIndex = None,
+                 block_key: Callable[[dict], BlockKey] = None, fingerprints: FingerprintIndex = None,
+                 images: ImageFingerprintIndex = None):
+        self.lsh = lsh
+        self.fingerprints = fingerprints
+        self.images = images
+        self.block_key = block_key
+        self._pages: "OrderedDict[str, dict]" = OrderedDict()
+        self._rank: Dict[str, int] = {}
+        self._blocks: Dict[BlockKey, set] = {}
+        self._block_of: Dict[str, BlockKey] = {}
+        self.comparisons_possible = 0
+        self.comparisons_scored = 0
+        self.recall_checks = 0
+        self.recall_expected = 0
+        self.recall_found = 0
+        ordered = sorted((p for p in pages or [] if p.get("status") != "expired"),
+                         key=lambda x: x.get("created_time", ""), reverse=True)
+        self._next_rank = len(ordered)
+        for i, page in enumerate(ordered):
+            self._insert(page, len(ordered) - i)
+
+    def _insert(self, page: dict, rank: int):
+        page_id = page["id"]
+        self._pages[page_id] = page
+        self._rank[page_id] = rank
+        if self.lsh is not None:
+            self.lsh.add(page)
+        if self.fingerprints is not None:
+            self.fingerprints.add(page)
+        if self.images is not None:
+            self.images.add(page)
+        if self.block_key is not None:
+            # Una pagina reinserita con una chiave diversa non deve restare nel bucket precedente
+            if page_id in self._block_of:
+                _discard(self._blocks, self._block_of[page_id], page_id)
+            key = self.block_key(page)
+            self._blocks.setdefault(key, set()).add(page_id)
+            self._block_of[page_id] = key
+
+    def add(self, page: dict):
+        """Aggiunge una pagina appena creata (la più recente)."""
+        self._next_rank += 1
+        self._insert(page, self._next_rank)
+        self._pages.move_to_end(page["id"], last=False)
+
+    def expire(self, page_id: str) -> Optional[dict]:
+        """Rimuove una pagina marcata "expired" e ne aggiorna lo status in memoria."""
+        page = self._pages.pop(page_id, None)
+        self._rank.pop(page_id, None)
+        if page is not None:
+            page["status"] = "expired"
+        if self.lsh is not None:
+            self.lsh.remove(page_id)
+        if self.fingerprints is not None:
+            self.fingerprints.remove(page_id)
+        if self.images is not None:
+            self.images.remove(page_id)
+        if page_id in self._block_of:
+            _discard(self._blocks, self._block_of.pop(page_id), page_id)
+        return page
+
+    def get(self, page_id: str) -> Optional[dict]:
+        return self._pages.get(page_id)
+
+    def pages(self) -> List[dict]:
+        """Tutte le pagine attive, dalla più recente."""
+        return list(self._pages.values())
+
+    def _block_ids(self, key: BlockKey) -> set:
+        """Id delle pagine nei bucket compatibili con la chiave (stessa zona, fascia ±1, sconosciuti)."""
+        zone, band = key
+        ids = set()
+        for (page_zone, page_band), page_ids in self._blocks.items():
+            if zone is not None and page_zone is not None and page_zone != zone:
+                continue
+            if band is not None and page_band is not None and abs(page_band - band) > 1:
+                continue
+            ids.update(page_ids)
+        return ids
+
+    def candidates(self, tokens_list: List[List[str]], block: BlockKey = None) -> List[dict]:
+        """Candidati dalla più recente: unione dei candidati LSH per i token dati (tutte le
+        pagine senza LSH), ristretta ai bucket compatibili con `block` se indicato."""
+        if self.lsh is None and block is None:
+            return self.pages()
+        if self.lsh is not None:
+            candidate_ids = set()
+            for tokens in tokens_list:
+                candidate_ids.update(page["id"] for page in self.lsh.query(tokens))
+        else:
+            candidate_ids = set(self._pages)
+        if block is not None and self.block_key is not None:
+            candidate_ids &= self._block_ids(block)
+        ordered_ids = sorted((page_id for page_id in candidate_ids if page_id in self._rank),
+                             key=self._rank.__getitem__, reverse=True)
+        return [self._pages[page_id] for page_id in ordered_ids]
+
+    def fingerprint_match(self, normalized: str, tokens: List[str],
+                          fingerprint: Tuple[bytes, int] = None) -> Tuple[Optional[dict], float]:
+        """Duplicato risolto dalle impronte, senza confronto fuzzy.
+
+        Testo identico → pagina più recente con punteggio 1.0; vicini SimHash → il più
+        vicino (a parità il più recente) con punteggio stimato 1 - distanza/64.
+        (None, 0.0) se il caso è ambiguo e va verificato con il confronto fuzzy.
+        """
+        if self.fingerprints is None or not normalized:
+            return None, 0.0
+        exact_ids, near = self.fingerprints.query(normalized, tokens, fingerprint)
+        exact_ids = [page_id for page_id in exact_ids if page_id in self._rank]
+        if exact_ids:
+            return self._pages[max(exact_ids, key=self._rank.__getitem__)], 1.0
+        near = {page_id: d for page_id, d in near.items() if page_id in self._rank}
+        if near:
+            page_id = min(near, key=lambda pid: (near[pid], -self._rank[pid]))
+            return self._pages[page_id], 1.0 - near[page_id] / 64
+        return None, 0.0
+
+    def image_match(self, urls) -> Tuple[Optional[dict], float]:
+        """Pagina attiva più recente che condivide un'immagine con il post (punteggio 1.0),
+        altrimenti (None, 0.0)."""
+        if self.images is None or not urls:
+            return None, 0.0
+        page_ids = [page_id for page_id in self.images.query(urls) if page_id in self._rank]
+        if page_ids:
+            return self._pages[max(page_ids, key=self._rank.__getitem__)], 1.0
+        return None, 0.0
+
+    def record_comparisons(self, queries: int, scored: int):
+        """Confronti fuzzy eseguiti rispetto a quelli di una scansione completa."""
+        self.comparisons_possible += queries * len(self._pages)
+        self.comparisons_scored += scored
+
+    def record_recall(self, brute_force_hit: bool, index_hit: bool):
+        """Confronto con la scansione completa: conta i duplicati che LSH/blocking avrebbero perso."""
+        self.recall_checks += 1
+        if brute_force_hit:
+            self.recall_expected += 1
+            if index_hit:
+                self.recall_found += 1
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def describe(self) -> str:
+        skipped = self.comparisons_possible - self.comparisons_scored
+        ratio = skipped / self.comparisons_possible if self.comparisons_possible else 0.0
+        text = (f"Dedup index: {len(self._pages)} active pages, {self.comparisons_scored} comparisons scored, "
+                f"{skipped} skipped ({ratio:.0%})")
+        if self.block_key is not None:
+            text += f", {len(self._blocks)} blocking buckets"
+        if self.recall_checks:
+            recall = self.recall_found / self.recall_expected if self.recall_expected else 1.0
+            text += (f", recall {recall:.1%} ({self.recall_found}/{self.recall_expected} brute-force duplicates"
+                     f" over {self.recall_checks} checks)")
+        return text
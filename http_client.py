@@ -0,0 +1,297 @@
+# http_client.py
+# Client HTTP condiviso per Notion e OpenRouter
+#
+# - una requests.Session per host (connessioni keep-alive riusate, niente handshake TLS a ogni chiamata)
+# - timeout di default (connect, read) per host, così un socket appeso non blocca il job orario
+# - limite di richieste concorrenti per host
+# - contatori e istogramma delle latenze per host
+# - retry con backoff esponenziale e full jitter, rispettando Retry-After / X-RateLimit-Reset
+# - circuit breaker per host: dopo ripetuti errori le richieste falliscono subito per un periodo
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Limiti superiori (secondi) dei bucket dell'istogramma delle latenze
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+class CircuitOpenError(requests.RequestException):
+    """Il circuit breaker dell'host è aperto: la richiesta non è stata inviata."""
+
+
+class RetryPolicy:
+    """Quali errori ritentare e quanto aspettare.
+
+    Ritentabili: errori di rete/timeout e gli status in `retry_statuses`. L'attesa è
+    quella indicata dal server (Retry-After, X-RateLimit-Reset) se presente, altrimenti
+    backoff esponenziale con full jitter: uniforme in [0, min(max_delay, base_delay·2^tentativo)].
+    Se il server chiede di aspettare più di `max_wait` secondi si rinuncia subito.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 max_wait: float = 120.0, retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.retry_statuses = retry_statuses
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def server_delay(response: requests.Response) -> Optional[float]:
+        """Attesa richiesta dal server in secondi (None se non indicata)."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        reset = response.headers.get("X-RateLimit-Reset")
+        if reset:
+            try:
+                value = float(reset)
+            except ValueError:
+                return None
+            # Epoch in millisecondi (OpenRouter), epoch in secondi oppure secondi mancanti
+            if value > 1e12:
+                return max(value / 1000 - time.time(), 0.0)
+            if value > 1e9:
+                return max(value - time.time(), 0.0)
+            return max(value, 0.0)
+        return None
+
+
+class CircuitBreaker:
+    """Apre il circuito dopo `failure_threshold` errori consecutivi; dopo `reset_timeout`
+    secondi lascia passare una richiesta di prova (half-open) e lo richiude se va a buon fine.
+    `open_for` lo apre subito per un tempo dato (es. quota esaurita fino al reset indicato dal server)."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until: Optional[float] = None
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.open_until is None:
+                return True
+            if time.monotonic() >= self.open_until:
+                # Half-open: una richiesta di prova, il circuito si riapre se fallisce
+                self.open_until = None
+                self.failures = self.failure_threshold - 1
+                return True
+            return False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.open_until is not None and time.monotonic() < self.open_until
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.open_until is None:
+                self.open_until = time.monotonic() + self.reset_timeout
+                self.times_opened += 1
+
+    def open_for(self, seconds: float):
+        with self._lock:
+            if self.open_until is None:
+                self.times_opened += 1
+            self.open_until = max(self.open_until or 0.0, time.monotonic() + seconds)
+
+
+class HostPolicy:
+    """Timeout, concorrenza massima, retry e circuit breaker per un host."""
+
+    def __init__(self, timeout: Tuple[float, float] = (5, 30), max_concurrency: int = 4,
+                 retry: RetryPolicy = None, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.retry = retry or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+
+class HostStats:
+    """Contatori e istogramma delle latenze di un host."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.retry_wait = 0.0
+        self.circuit_rejections = 0
+        self.status_codes: Dict[int, int] = {}
+        self.total_latency = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, latency: float, status_code: Optional[int]):
+        self.requests += 1
+        self.total_latency += latency
+        if status_code is None:
+            self.errors += 1
+        else:
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+        for i, upper in enumerate(LATENCY_BUCKETS):
+            if latency <= upper:
+                self.histogram[i] += 1
+                break
+
+    def describe(self, host: str) -> str:
+        avg = self.total_latency / self.requests if self.requests else 0.0
+        codes = ", ".join(f"{code}×{count}" for code, count in sorted(self.status_codes.items()))
+        buckets = " ".join(
+            f"≤{upper:g}s:{count}" if upper != float("inf") else f">{LATENCY_BUCKETS[-2]:g}s:{count}"
+            for upper, count in zip(LATENCY_BUCKETS, self.histogram) if count
+        )
+        text = (f"{host}: {self.requests} requests, {self.errors} errors, avg {avg:.2f}s "
+                f"[{codes}] latency {buckets}")
+        if self.retries or self.circuit_rejections:
+            text += (f", {self.retries} retries ({self.retry_wait:.1f}s waiting), "
+                     f"{self.circuit_rejections} rejected by open circuit")
+        return text
+
+
+class HttpClient:
+    """Sessioni HTTP condivise per host, con timeout, limiti di concorrenza, retry, circuit breaker e statistiche."""
+
+    def __init__(self, policies: Dict[str, HostPolicy] = None, default_policy: HostPolicy = None):
+        self.policies = policies or {}
+        self.default_policy = default_policy or HostPolicy()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._stats: Dict[str, HostStats] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def _policy(self, host: str) -> HostPolicy:
+        return self.policies.get(host, self.default_policy)
+
+    def _host_state(self, host: str):
+        with self._lock:
+            if host not in self._sessions:
+                policy = self._policy(host)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(policy.max_concurrency, 1))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+                self._semaphores[host] = threading.BoundedSemaphore(max(policy.max_concurrency, 1))
+                self._stats[host] = HostStats()
+                self._breakers[host] = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+            return self._sessions[host], self._semaphores[host], self._stats[host]
+
+    def _send(self, session: requests.Session, semaphore: threading.BoundedSemaphore, stats: HostStats,
+              method: str, url: str, **kwargs) -> requests.Response:
+        with semaphore:
+            start = time.monotonic()
+            status_code = None
+            try:
+                response = session.request(method, url, **kwargs)
+                status_code = response.status_code
+                return response
+            finally:
+                latency = time.monotonic() - start
+                with self._lock:
+                    stats.record(latency, status_code)
+
+    def request(self, method: str, url: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """Esegue la richiesta sulla sessione dell'host, ritentando gli errori transitori.
+
+        I 429 si ritentano sempre (la richiesta non è stata elaborata), a meno che il server
+        indichi un'attesa oltre `max_wait`: in quel caso il circuito resta aperto fino al reset.
+        Errori di rete e 5xx solo se `idempotent`, per non creare due volte la stessa risorsa. Le altre risposte
+        (anche di errore) sono ritornate al chiamante. Le eccezioni di rete dell'ultimo
+        tentativo vengono rilanciate; CircuitOpenError se l'host è in errore da troppo tempo.
+        """
+        host = urlsplit(url).netloc
+        session, semaphore, stats = self._host_state(host)
+        policy = self._policy(host)
+        breaker = self._breakers[host]
+        kwargs.setdefault("timeout", policy.timeout)
+        retry = policy.retry
+        
+        for attempt in range(retry.max_attempts):
+            if not breaker.allow():
+                with self._lock:
+                    stats.circuit_rejections += 1
+                raise CircuitOpenError(f"circuit open for {host} (repeated failures or rate limit reset pending)")
+            last_attempt = attempt == retry.max_attempts - 1
+            try:
+                response = self._send(session, semaphore, stats, method, url, **kwargs)
+            except requests.RequestException:
+                breaker.record_failure()
+                if not idempotent or last_attempt:
+                    raise
+                delay = retry.backoff(attempt)
+            else:
+                if response.status_code not in retry.retry_statuses:
+                    breaker.record_success()
+                    return response
+                if response.status_code != 429:
+                    breaker.record_failure()
+                    if not idempotent:
+                        return response
+                if last_attempt:
+                    return response
+                delay = retry.server_delay(response)
+                if delay is None:
+                    delay = retry.backoff(attempt)
+                elif delay > retry.max_wait:
+                    # Limite che si libera troppo tardi (es. quota giornaliera): il provider è
+                    # indisponibile fino al reset, niente altre richieste fino ad allora
+                    breaker.open_for(delay)
+                    return response
+            with self._lock:
+                stats.retries += 1
+                stats.retry_wait += delay
+            time.sleep(delay)
+
+    def circuit_open(self, host: str) -> bool:
+        breaker = self._breakers.get(host)
+        return breaker is not None and breaker.is_open()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def stats(self) -> Dict[str, HostStats]:
+        return dict(self._stats)
+
+    def describe(self) -> str:
+        return "\n".join(stats.describe(host) for host, stats in self._stats.items())
+
+
+# Istanza globale condivisa (Notion: ~3 richieste/s consentite; OpenRouter: risposte LLM lente,
+# limiti per minuto sui modelli gratuiti)
+http = HttpClient({
+    "api.notion.com": HostPolicy(timeout=(5, 30), max_concurrency=3,
+                                 retry=RetryPolicy(max_attempts=4, base_delay=1, max_delay=20)),
+    "openrouter.ai": HostPolicy(timeout=(5, 120), max_concurrency=4,
+                                retry=RetryPolicy(max_attempts=3, base_delay=4, max_delay=60)),
+})
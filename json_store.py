@@ -0,0 +1,28 @@
+# json_store.py
+# Scrittura atomica dei file JSON persistenti (cache, memo, snapshot)
+#
+# Si scrive su un file .tmp accanto al file finale e lo si sostituisce con os.replace:
+# un run interrotto a metà scrittura non lascia mai un file troncato.
+
+import json
+import os
+
+
+def write_json_atomic(path: str, data, **dump_kwargs):
+    """Scrive `data` in `path` in modo atomico; solleva l'eccezione in caso di errore."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_file = f"{path}.tmp"
+    dump_kwargs.setdefault("ensure_ascii", False)
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_kwargs)
+    os.replace(tmp_file, path)
+
+
+def save_json_atomic(path: str, data, label: str, **dump_kwargs) -> bool:
+    """Come write_json_atomic, ma stampa l'errore (`label` identifica il file) e ritorna False."""
+    try:
+        write_json_atomic(path, data, **dump_kwargs)
+        return True
+    except Exception as e:
+        print(f"⚠️ {label} save error: {e}")
+        return False
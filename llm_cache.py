@@ -0,0 +1,83 @@
+# llm_cache.py
+# Cache persistente dei risultati LLM indirizzata per contenuto
+#
+# Lo stesso annuncio pubblicato in più gruppi (più feed) o ripubblicato con un nuovo
+# link ha lo stesso testo: la chiave è l'hash di titolo e testo normalizzati, del
+# modello e della versione del prompt, così il modello lo analizza una sola volta.
+
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from json_store import save_json_atomic
+
+
+class LLMResultCache:
+    """Risultato parsato del modello per ogni post (incluso `relevant_listing`), con TTL
+    ed eviction LRU oltre `max_size` voci."""
+
+    def __init__(self, path: str, ttl_hours: float = 168, max_size: int = 5000):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f).get('entries', {})
+                # Le voci sono salvate dalla meno recente alla più recente
+                self._entries = OrderedDict(entries)
+            except Exception as e:
+                print(f"⚠️ LLM cache loading error: {e}")
+                self._entries = OrderedDict()
+        return self
+
+    def get(self, key: str) -> Optional[dict]:
+        """Copia del risultato salvato, None se assente o scaduto."""
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry['ts'] > self.ttl_seconds:
+            del self._entries[key]
+            self._dirty = True
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry['item'])
+
+    def put(self, key: str, item: dict):
+        self._entries[key] = {'item': dict(item), 'ts': time.time()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._dirty = True
+
+    def save(self):
+        """Salvataggio atomico, eliminando le voci scadute; nessuna scrittura se non è cambiato nulla."""
+        now = time.time()
+        stale = [key for key, entry in self._entries.items() if now - entry['ts'] > self.ttl_seconds]
+        for key in stale:
+            del self._entries[key]
+        if not self._dirty and not stale:
+            return
+        if save_json_atomic(self.path, {'entries': self._entries}, "LLM cache", separators=(",", ":")):
+            self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def describe(self) -> str:
+        return (f"LLM cache: {len(self._entries)}/{self.max_size} entries, {self.hits} hits, "
+                f"{self.misses} misses, {self.expired} expired, {self.evictions} evictions")
@@ -0,0 +1,127 @@
+# llm_dispatcher.py
+# Esecuzione concorrente delle chiamate LLM con rate limiting a token bucket
+#
+# - più batch in volo contemporaneamente (thread pool), risultati restituiti nell'ordine di invio
+# - due bucket: richieste al minuto e token al minuto (stimati prima della chiamata)
+# - al posto delle attese fisse tra un batch e l'altro si aspetta solo quando il bucket è vuoto
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate_per_minute` token ricaricati in modo continuo,
+    al massimo `capacity` accumulabili (default: un minuto di token)."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # Tempo reale con almeno un chiamante in attesa: le attese concorrenti non si sommano
+        self.waited = 0.0
+        self._waiters = 0
+        self._wait_started = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """Blocca finché sono disponibili `amount` token (richieste più grandi della capacità
+        consumano l'intero bucket)."""
+        amount = min(amount, self.capacity)
+        waiting = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._tokens >= amount:
+                        self._tokens -= amount
+                        return
+                    wait = (amount - self._tokens) / self.rate
+                    if not waiting:
+                        waiting = True
+                        if self._waiters == 0:
+                            self._wait_started = now
+                        self._waiters += 1
+                time.sleep(wait)
+        finally:
+            if waiting:
+                with self._lock:
+                    self._waiters -= 1
+                    if self._waiters == 0:
+                        self.waited += time.monotonic() - self._wait_started
+
+
+class LLMDispatcher:
+    """Esegue `call(batch)` su più thread rispettando i limiti di richieste e token al minuto.
+    Al massimo `max_in_flight` chiamate in corso, comprese quelle sincrone di `call` (retry)."""
+
+    def __init__(self, call: Callable[[Any], Any], max_in_flight: int = 3, requests_per_minute: float = 20,
+                 tokens_per_minute: float = 0, estimate_tokens: Callable[[Any], int] = None,
+                 is_available: Callable[[], bool] = None):
+        self.call_fn = call
+        self.is_available = is_available or (lambda: True)
+        self.max_in_flight = max(max_in_flight, 1)
+        self.requests_bucket = TokenBucket(requests_per_minute, capacity=self.max_in_flight) \
+            if requests_per_minute > 0 else None
+        self.tokens_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.estimate_tokens = estimate_tokens or (lambda batch: 0)
+        self.calls = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+
+    def call(self, batch) -> Any:
+        """Chiamata sincrona (stessi limiti delle chiamate concorrenti).
+        Ritorna None senza chiamare né consumare token se il provider non è disponibile."""
+        if not self.is_available():
+            with self._lock:
+                self.skipped += 1
+            return None
+        with self._slots:
+            if self.requests_bucket is not None:
+                self.requests_bucket.acquire()
+            if self.tokens_bucket is not None:
+                self.tokens_bucket.acquire(self.estimate_tokens(batch))
+            with self._lock:
+                self.calls += 1
+            return self.call_fn(batch)
+
+    def map_ordered(self, batches: Iterable) -> Iterator[Tuple[Any, Any]]:
+        """Ritorna (batch, risultato) nell'ordine dei batch, con al massimo `max_in_flight` chiamate in corso."""
+        pending = deque()
+        batches = iter(batches)
+        pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="llm")
+        finished = False
+        try:
+            for batch in batches:
+                pending.append((batch, pool.submit(self.call, batch)))
+                if len(pending) >= self.max_in_flight:
+                    break
+            while pending:
+                batch, future = pending.popleft()
+                result = future.result()
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    pending.append((next_batch, pool.submit(self.call, next_batch)))
+                yield batch, result
+            finished = True
+        finally:
+            # Se si esce per un'eccezione (es. SystemExit da SIGTERM) non si aspettano le chiamate
+            # in volo: il chiamante deve arrivare subito al salvataggio delle cache
+            pool.shutdown(wait=finished, cancel_futures=True)
+
+    def describe(self) -> str:
+        waited = sum(bucket.waited for bucket in (self.requests_bucket, self.tokens_bucket) if bucket is not None)
+        text = (f"LLM dispatcher: {self.calls} calls, up to {self.max_in_flight} in flight, "
+                f"{waited:.1f}s waiting on rate limits")
+        if self.skipped:
+            text += f", {self.skipped} batches skipped (provider unavailable)"
+        return text
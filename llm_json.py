@@ -0,0 +1,133 @@
+# llm_json.py
+# Estrazione tollerante di JSON dalle risposte LLM
+#
+# I modelli avvolgono spesso il JSON in blocchi ```json, aggiungono testo prima o dopo,
+# lasciano virgole finali o troncano la risposta. Qui si cerca il valore JSON più
+# esterno e, se l'array non è valido nel suo insieme, si recuperano i singoli elementi.
+
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+_FENCE = re.compile(r"```[a-zA-Z0-9_-]*\s*\n?(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_SCALAR = re.compile(r'"(?:[^"\\]|\\.)*"|[^,\]]+')
+
+
+def _loads(text: str) -> Any:
+    """json.loads con riparazione delle virgole finali (`{"a": 1,}`); solleva ValueError."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+
+
+def _strip_fences(text: str) -> str:
+    fenced = _FENCE.findall(text)
+    return max(fenced, key=len) if fenced else text
+
+
+def _balanced_span(text: str, start: int) -> Tuple[int, bool]:
+    """Fine (esclusa) del valore che inizia con la parentesi in `start`, ignorando quelle
+    nelle stringhe. Ritorna (fine, chiuso): se il testo è troncato, (len(text), False)."""
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+            if depth == 0:
+                return i + 1, True
+    return len(text), False
+
+
+_OPENERS = re.compile(r"[\[{]")
+
+
+def extract_json(text: Optional[str]) -> Any:
+    """Valore JSON della risposta (blocchi ``` e testo attorno esclusi), None se non ce n'è uno valido.
+    Le parentesi nel testo attorno ("Here are the results [as requested]:") vengono saltate:
+    si prova ogni parentesi di apertura finché un valore non si decodifica."""
+    if not text:
+        return None
+    text = _strip_fences(text).strip()
+    try:
+        return _loads(text)
+    except ValueError:
+        pass
+    match = _OPENERS.search(text)
+    while match:
+        end, _ = _balanced_span(text, match.start())
+        try:
+            return _loads(text[match.start():end])
+        except ValueError:
+            # Si riparte dopo il valore scartato: le sue parentesi interne non sono il valore più esterno
+            match = _OPENERS.search(text, end)
+    return None
+
+
+def _salvage_items(text: str, start: int) -> Tuple[List[Optional[Any]], int]:
+    """Elementi dell'array che inizia in `start` e fine (esclusa) della parte letta."""
+    items: List[Optional[Any]] = []
+    i = start + 1
+    while i < len(text):
+        char = text[i]
+        if char == "]":
+            return items, i + 1
+        if char in "{[":
+            end, closed = _balanced_span(text, i)
+            if not closed:
+                break
+            try:
+                items.append(_loads(text[i:end]))
+            except ValueError:
+                items.append(None)
+            i = end
+        elif char == '"' or char.isalnum() or char == "-":
+            # Valore scalare non previsto (o testo spurio) nell'array: conta come elemento malformato
+            match = _SCALAR.match(text, i)
+            items.append(None)
+            i = match.end() if match else i + 1
+        else:
+            i += 1
+    return items, len(text)
+
+
+def salvage_array(text: Optional[str]) -> List[Optional[Any]]:
+    """Elementi dell'array più esterno nella risposta, nell'ordine; None al posto di ogni
+    elemento malformato. Una risposta troncata restituisce gli elementi completi."""
+    if not text:
+        return []
+    value = extract_json(text)
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        # Oggetto singolo oppure array annidato sotto una chiave ({"posts": [...]})
+        nested = [v for v in value.values() if isinstance(v, list)]
+        return nested[0] if len(nested) == 1 else [value]
+
+    # Il primo array con almeno un elemento valido; le parentesi del testo attorno
+    # ("[as requested]") danno solo elementi malformati e vengono saltate
+    text = _strip_fences(text)
+    first: Optional[List[Optional[Any]]] = None
+    start = text.find("[")
+    while start >= 0:
+        items, end = _salvage_items(text, start)
+        if any(item is not None for item in items):
+            return items
+        if first is None:
+            first = items
+        start = text.find("[", end)
+    return first or []
@@ -0,0 +1,71 @@
+# lru_cache.py
+# Cache LRU limitata con contatori hit/miss/eviction, usata per normalizzazione e similarità
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+
+def content_key(text: Optional[str]) -> bytes:
+    """Chiave compatta (128 bit) per un testo: evita di tenere in memoria stringhe di diversi KB come chiavi."""
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=16).digest()
+
+
+class LRUCache:
+    """Cache LRU con dimensione massima e statistiche di utilizzo."""
+
+    def __init__(self, max_size: int = 1000, name: str = "cache"):
+        self.max_size = max_size
+        self.name = name
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if key in self._data:
+            self._data.move_to_end(key)
+        self._data[key] = value
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate(),
+        }
+
+    def describe(self) -> str:
+        return (f"{self.name}: {len(self._data)}/{self.max_size} entries, "
+                f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions "
+                f"({self.hit_rate():.0%} hit rate)")
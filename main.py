@@ -1,15 +1,26 @@
 import os
-import requests
+from http_client import CircuitOpenError, http
 import json
 import time
 import feedparser
 import re
-import unicodedata
-from datetime import datetime, timedelta
-from rapidfuzz import fuzz
-from cities_config import get_city_config, get_current_city, get_macro_zones_for_city, get_zone_mapping_for_city, get_rss_urls_for_city
+import signal
+from dataclasses import replace
+from collections import deque
+from cities_config import get_city_config, get_current_city, get_macro_zones_for_city, get_zone_index_for_city, get_rss_urls_for_city
 from bs4 import BeautifulSoup
 from censorship import censor_sensitive_data, has_sensitive_data
+from rejected_cache import create_rejected_store
+from lru_cache import LRUCache, content_key
+from dedup import (DedupCandidateIndex, DescriptionMemo, FingerprintIndex, ImageFingerprintIndex, ListingFeatures,
+                   MinHashLSHIndex, parse_price, pick_best_matches, price_band, similarity_matrix)
+from notion_snapshot import NotionSnapshot
+from llm_dispatcher import LLMDispatcher
+from llm_cache import LLMResultCache
+from llm_json import extract_json, salvage_array
+from relevance_prefilter import RelevancePrefilter
+from zone_memo import ZoneMacroMemo
+from zone_matcher import normalize_zone_text as _normalize_for_zone
 
 # CONFIGURAZIONE
 NOTION_API_KEY = os.environ["NOTION_API_KEY"]
@@ -26,161 +37,163 @@ CACHE_FILE = CITY_CONFIG.cache_file if CITY_CONFIG else "rejected_urls_cache.jso
 CACHE_CLEANUP_HOURS = 48
 MAX_CACHE_SIZE = 1000  # Massimo numero di URL in cache
 
-# Cache in memoria per performance
-_cache_data = None
-_cache_last_load = None
-
-# Cache per calcoli di similarità (evita ricalcoli)
-_similarity_cache = {}
-
-# Cache per normalizzazione testo
-_text_normalization_cache = {}
-
-
-
-def load_rejected_cache():
-    """Carica la cache degli URL scartati dall'AI con TTL individuale."""
-    global _cache_data, _cache_last_load
-    
-    # Controlla se il file è stato modificato
-    if os.path.exists(CACHE_FILE):
-        file_mtime = os.path.getmtime(CACHE_FILE)
-        if _cache_data is not None and _cache_last_load == file_mtime:
-            return _cache_data  # Usa cache in memoria
-    
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-                # Pulisci URL scaduti (TTL individuale)
-                current_time = datetime.now()
-                expired_urls = []
-                cleaned_urls = {}
-                
-                for url, url_data in data.get('urls', {}).items():
-                    url_timestamp = datetime.fromisoformat(url_data['timestamp'])
-                    if current_time - url_timestamp > timedelta(hours=CACHE_CLEANUP_HOURS):
-                        expired_urls.append(url)
-                    else:
-                        cleaned_urls[url] = url_data
-                
-                if expired_urls:
-                    print(f"🗑️ Removed {len(expired_urls)} expired URLs from cache (TTL {CACHE_CLEANUP_HOURS}h)")
-                
-                # Mantieni il contatore persistente (non si azzera mai)
-                total_rejected_count = data.get('total_rejected_count', 0)
-                
-                _cache_data = {
-                    'urls': cleaned_urls,
-                    'total_rejected_count': total_rejected_count,
-                    'timestamp': current_time.isoformat()
-                }
-                _cache_last_load = file_mtime
-                return _cache_data
-        except Exception as e:
-            print(f"⚠️ Cache loading error: {e}")
-    
-    # Inizializza cache vuota con contatore a 0
-    _cache_data = {
-        'urls': {}, 
-        'total_rejected_count': 0,
-        'timestamp': datetime.now().isoformat()
-    }
-    _cache_last_load = None
-    return _cache_data
-
-def save_rejected_cache(cache_data):
-    """Salva la cache degli URL scartati dall'AI."""
-    global _cache_data, _cache_last_load
-    
-    try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
-        
-        # Aggiorna cache in memoria
-        _cache_data = cache_data
-        _cache_last_load = os.path.getmtime(CACHE_FILE) if os.path.exists(CACHE_FILE) else None
-        
-        print(f"💾 Cache saved to: {os.path.abspath(CACHE_FILE)}")
-        print(f"📊 URLs in cache: {len(cache_data['urls'])}")
-    except Exception as e:
-        print(f"⚠️ Cache save error: {e}")
+# Directory per le cache persistenti tra i run (in CI viene ripristinata con actions/cache)
+CACHE_DIR = os.environ.get("ROOMRADAR_CACHE_DIR", ".cache")
+DEDUP_MEMO_FILE = os.path.join(CACHE_DIR, f"dedup_memo_{CURRENT_CITY}.json")
+
+# Cache dei risultati LLM per contenuto (post identici in più feed o ripubblicati con nuovo link)
+LLM_RESULT_CACHE = os.environ.get("LLM_RESULT_CACHE", "1") == "1"
+LLM_CACHE_FILE = os.path.join(CACHE_DIR, f"llm_cache_{CURRENT_CITY}.json")
+LLM_CACHE_TTL_HOURS = float(os.environ.get("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_MAX_SIZE = int(os.environ.get("LLM_CACHE_MAX_SIZE", "5000"))
+
+# Memo zona → macro-zona imparato dal fallback AI (zone per richiesta al modello)
+ZONE_MEMO_FILE = os.path.join(CACHE_DIR, f"zone_memo_{CURRENT_CITY}.json")
+ZONE_FALLBACK_BATCH = int(os.environ.get("ZONE_FALLBACK_BATCH", "50"))
+
+# Prefiltro locale di rilevanza: scarta senza LLM chi cerca casa e gli affitti a notte.
+# Una frazione dei post scartabili va comunque al modello per stimare precision/recall
+RELEVANCE_PREFILTER = os.environ.get("RELEVANCE_PREFILTER", "1") == "1"
+PREFILTER_REJECT_SCORE = float(os.environ.get("PREFILTER_REJECT_SCORE", "2"))
+PREFILTER_SHADOW_RATE = float(os.environ.get("PREFILTER_SHADOW_RATE", "0.1"))
+PREFILTER_STATS_FILE = os.path.join(CACHE_DIR, f"prefilter_stats_{CURRENT_CITY}.json")
+
+# Sync incrementale di Notion: snapshot locale + riconciliazione completa periodica
+NOTION_INCREMENTAL_SYNC = os.environ.get("NOTION_INCREMENTAL_SYNC", "1") == "1"
+NOTION_FULL_SYNC_HOURS = float(os.environ.get("NOTION_FULL_SYNC_HOURS", "24"))
+NOTION_SNAPSHOT_FILE = os.path.join(CACHE_DIR, f"notion_snapshot_{CURRENT_CITY}.json")
+
+# Query "slim": filtro status lato server e solo le property effettivamente lette
+NOTION_SLIM_QUERIES = os.environ.get("NOTION_SLIM_QUERIES", "1") == "1"
+
+# Backend dello store degli URL scartati: "log" (append-only, default) o "json" (riscrittura completa)
+REJECTED_CACHE_BACKEND = os.environ.get("REJECTED_CACHE_BACKEND", "log")
+# Write-behind: gli scarti restano in memoria e vengono scritti con un'unica flush atomica
+# a fine run (o ogni REJECTED_CACHE_FLUSH_EVERY nuovi scarti, 0 = solo a fine run)
+REJECTED_CACHE_WRITE_BEHIND = os.environ.get("REJECTED_CACHE_WRITE_BEHIND", "1") == "1"
+REJECTED_CACHE_FLUSH_EVERY = int(os.environ.get("REJECTED_CACHE_FLUSH_EVERY", "50"))
+
+# Store degli URL scartati (caricato una sola volta per processo)
+_rejected_store = None
+
+# Dimensione della cache LRU in memoria (configurabile per database con migliaia di annunci attivi)
+NORMALIZE_CACHE_SIZE = int(os.environ.get("NORMALIZE_CACHE_SIZE", "5000"))
+
+# Cache per normalizzazione testo, chiave = hash del testo
+_text_normalization_cache = LRUCache(NORMALIZE_CACHE_SIZE, name="Text cache")
+
+# Memo persistente delle descrizioni normalizzate (caricato al primo utilizzo)
+_description_memo = None
+
+# Cache persistente dei risultati LLM (caricata al primo utilizzo)
+_llm_cache = None
+
+# Prefiltro di rilevanza (creato al primo utilizzo)
+_relevance_prefilter = None
+
+# Memo delle macro-zone imparate (caricato al primo utilizzo)
+_zone_memo = None
+
+
+
+def get_rejected_store():
+    """Restituisce lo store degli URL scartati, caricandolo al primo utilizzo."""
+    global _rejected_store
+    if _rejected_store is None:
+        _rejected_store = create_rejected_store(
+            CACHE_FILE,
+            backend=REJECTED_CACHE_BACKEND,
+            ttl_hours=CACHE_CLEANUP_HOURS,
+            max_size=MAX_CACHE_SIZE,
+            write_behind=REJECTED_CACHE_WRITE_BEHIND,
+            flush_every=REJECTED_CACHE_FLUSH_EVERY
+        ).load()
+    return _rejected_store
+
+def flush_rejected_cache():
+    """Scrive su disco lo snapshot JSON della cache degli URL scartati."""
+    store = get_rejected_store()
+    store.flush()
+    print(f"💾 Cache saved to: {CACHE_FILE} ({len(store.urls)} URLs)")
+
+def _handle_sigterm(signum, frame):
+    """Trasforma SIGTERM in SystemExit così il flush finale della cache viene eseguito."""
+    print("🛑 SIGTERM received, flushing rejected cache before exit...")
+    raise SystemExit(128 + signum)
 
 def add_to_rejected_cache(url, reason="AI_SCRUTINY"):
     """Aggiunge un URL alla cache degli scartati con logica FIFO e incrementa il contatore persistente."""
-    print(f"🔄 Adding URL to cache: {url} (reason: {reason})")
-    print(f"📁 Current directory: {os.getcwd()}")
-    print(f"📁 Cache file: {os.path.abspath(CACHE_FILE)}")
-    
-    cache_data = load_rejected_cache()
-    
-    # Controlla se l'URL è già presente (per evitare doppi conteggi)
-    is_new_url = url not in cache_data['urls']
-    
-    # Se la cache è piena, rimuovi gli URL più vecchi (FIFO)
-    if len(cache_data['urls']) >= MAX_CACHE_SIZE:
-        print(f"🗑️ Cache full ({MAX_CACHE_SIZE} URLs), removing oldest URLs (FIFO)...")
-        # Ordina per timestamp (più vecchi prima) e rimuovi il 50% più vecchio
-        sorted_urls = sorted(cache_data['urls'].items(), 
-                           key=lambda x: x[1]['timestamp'])
-        # Rimuovi il 50% più vecchio per fare spazio (corretto)
-        remove_count = int(MAX_CACHE_SIZE * 0.5)  # 50% del limite
-        cache_data['urls'] = dict(sorted_urls[remove_count:])
-        print(f"🗑️ Removed {remove_count} oldest URLs (FIFO - 50%)")
-    
-    # Aggiungi/aggiorna l'URL
-    cache_data['urls'][url] = {
-        'reason': reason,
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    # Incrementa il contatore SOLO se è un nuovo URL
-    if is_new_url:
-        cache_data['total_rejected_count'] = cache_data.get('total_rejected_count', 0) + 1
-        print(f"📊 New rejected post added! Total rejected count: {cache_data['total_rejected_count']}")
+    store = get_rejected_store()
+    # Il contatore viene incrementato SOLO se è un nuovo URL (evita doppi conteggi)
+    if store.add(url, reason):
+        print(f"📊 New rejected post added ({reason})! Total rejected count: {store.total_rejected_count}")
     else:
-        print(f"📊 URL already in cache, total rejected count remains: {cache_data.get('total_rejected_count', 0)}")
-    
-    save_rejected_cache(cache_data)
-    
-    # Verifica immediata che il file sia stato creato
-    if os.path.exists(CACHE_FILE):
-        file_size = os.path.getsize(CACHE_FILE)
-        print(f"✅ Verification: Cache file created successfully ({file_size} bytes)")
-    else:
-        print(f"❌ ERROR: Cache file NOT found after saving!")
+        print(f"📊 URL already in cache, total rejected count remains: {store.total_rejected_count}")
+
+def get_description_memo():
+    """Restituisce il memo persistente delle descrizioni normalizzate."""
+    global _description_memo
+    if _description_memo is None:
+        _description_memo = DescriptionMemo(DEDUP_MEMO_FILE, normalize_text).load()
+    return _description_memo
+
+def flush_description_memo():
+    """Salva il memo delle descrizioni, se è stato usato in questo run."""
+    if _description_memo is not None:
+        _description_memo.save()
+
+def get_llm_cache():
+    """Restituisce la cache persistente dei risultati LLM."""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResultCache(LLM_CACHE_FILE, LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_SIZE).load()
+    return _llm_cache
+
+def flush_llm_cache():
+    """Salva la cache dei risultati LLM, se è stata usata in questo run."""
+    if _llm_cache is not None:
+        _llm_cache.save()
+
+def get_relevance_prefilter():
+    """Restituisce il prefiltro di rilevanza per le lingue della città corrente."""
+    global _relevance_prefilter
+    if _relevance_prefilter is None:
+        _relevance_prefilter = RelevancePrefilter(
+            CITY_CONFIG.languages if CITY_CONFIG else None,
+            reject_score=PREFILTER_REJECT_SCORE,
+            shadow_rate=PREFILTER_SHADOW_RATE,
+            stats_file=PREFILTER_STATS_FILE
+        ).load_stats()
+    return _relevance_prefilter
+
+def flush_prefilter_stats():
+    """Salva il confronto cumulativo tra prefiltro e decisioni del modello."""
+    if _relevance_prefilter is not None:
+        _relevance_prefilter.save_stats()
+
+def get_zone_memo():
+    """Restituisce il memo persistente zona → macro-zona della città corrente."""
+    global _zone_memo
+    if _zone_memo is None:
+        _zone_memo = ZoneMacroMemo(ZONE_MEMO_FILE, _normalize_for_zone).load()
+    return _zone_memo
+
+def flush_zone_memo():
+    """Salva il memo delle macro-zone, se sono state imparate nuove zone."""
+    if _zone_memo is not None:
+        _zone_memo.save()
 
 def is_url_rejected(url):
     """Controlla se un URL è nella cache degli scartati."""
-    cache_data = load_rejected_cache()
-    return url in cache_data['urls']
+    return get_rejected_store().contains(url)
 
 def get_cache_stats():
     """Restituisce statistiche dettagliate sulla cache."""
-    cache_data = load_rejected_cache()
-    urls = cache_data['urls']
-    
-    if not urls:
-        return 0, 0, 0
-    
-    # Calcola età media degli URL in cache
-    current_time = datetime.now()
-    ages = []
-    for url_data in urls.values():
-        url_time = datetime.fromisoformat(url_data['timestamp'])
-        age_hours = (current_time - url_time).total_seconds() / 3600
-        ages.append(age_hours)
-    
-    avg_age = sum(ages) / len(ages)
-    oldest_age = max(ages)
-    
-    return len(urls), avg_age, oldest_age
+    return get_rejected_store().stats()
 
 def get_total_rejected_count():
     """Restituisce il contatore totale dei post scartati dall'AI (persistente)."""
-    cache_data = load_rejected_cache()
-    return cache_data.get('total_rejected_count', 0)
+    return get_rejected_store().total_rejected_count
 
 # Configurazione RSS URLs - Feed specifici per città
 def get_rss_urls_for_current_city():
@@ -203,13 +216,51 @@ print(f"📡 Configured {len(RSS_URLS)} RSS feeds for {CURRENT_CITY}:")
 for i, url in enumerate(RSS_URLS, 1):
     print(f"  {i}. {url}")
 
-MAX_BATCH = 3
+# Batch LLM riempiti fino al budget di token stimati (≈4 caratteri per token) di prompt e risposta
+LLM_PROMPT_TOKEN_BUDGET = int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", "6000"))
+LLM_OUTPUT_TOKEN_BUDGET = int(os.environ.get("LLM_OUTPUT_TOKEN_BUDGET", "4000"))
+# Testi più lunghi vengono troncati (su un confine di parola) prima dell'invio al modello
+LLM_MAX_SUMMARY_CHARS = 6000
+# Per il punteggio di affidabilità basta sapere se ci sono foto: inviamo al massimo poche immagini
+LLM_MAX_PROMPT_IMAGES = 3
 MIN_BATCH = 1
-INITIAL_BACKOFF_SECONDS = 32
-MAX_BACKOFF_SECONDS = 62
+
+# Chiamate LLM concorrenti: batch in volo e limiti di rate (0 = nessun limite)
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", "3"))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "20"))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("LLM_TOKENS_PER_MINUTE", "0"))
+# Token di risposta stimati per post (il modello restituisce un oggetto JSON per post)
+LLM_OUTPUT_TOKENS_PER_POST = 400
+_llm_dispatcher = None
+
+# Property lette da _page_to_record per deduplicazione ed esistenza
+DEDUP_PROPERTIES = ["paraphrased_title", "original_description", "price", "zone", "zone_macro", "status", "link",
+                    "images"]
+LINK_PROPERTIES = ["link"]
+ACTIVE_PAGES_FILTER = {"property": "status", "select": {"does_not_equal": "expired"}}
+
+# ID delle property del database (letti dallo schema al primo utilizzo)
+_notion_property_ids = None
 
 # Soglie similarità per deduplica
 HIGH_DUP_THRESHOLD = 0.85  # sopra questa soglia segniamo direttamente il vecchio come "expired"
+# Soglia della deduplicazione prima del modello (impronte esatte/SimHash, stesso prezzo):
+# sopra, il post riusa i campi della pagina esistente
+PRE_LLM_DUP_THRESHOLD = 0.95
+DEDUP_BEFORE_LLM = os.environ.get("DEDUP_BEFORE_LLM", "1") == "1"
+
+# Indice MinHash/LSH per la ricerca dei candidati duplicati (0 = scansione lineare di tutte le pagine).
+# Le pagine con molti più (o molto meno) token del post sono sempre candidate: le ripubblicazioni
+# accorciate, che token_set_ratio considera duplicate, hanno Jaccard bassa e sfuggirebbero alle bande
+DEDUP_USE_LSH = os.environ.get("DEDUP_USE_LSH", "1") == "1"
+# Impronte esatte (hash) e quasi esatte (SimHash) consultate prima del confronto fuzzy
+DEDUP_FINGERPRINTS = os.environ.get("DEDUP_FINGERPRINTS", "1") == "1"
+# Indice delle immagini: i post che riusano le foto di una pagina attiva sono duplicati immediati
+DEDUP_IMAGE_INDEX = os.environ.get("DEDUP_IMAGE_INDEX", "1") == "1"
+# Blocking per (macro-zona, fascia di prezzo): ogni post è confrontato solo con le pagine compatibili
+DEDUP_BLOCKING = os.environ.get("DEDUP_BLOCKING", "0") == "1"
+# Esegue anche la scansione completa e riporta la recall di LSH/blocking a HIGH_DUP_THRESHOLD
+DEDUP_RECALL_CHECK = os.environ.get("DEDUP_RECALL_CHECK", "0") == "1"
 
 HEADERS_NOTION = {
     "Authorization": f"Bearer {NOTION_API_KEY}",
@@ -242,6 +293,9 @@ POSTS:
 {posts}
 """
 
+# Versione del prompt nella chiave della cache LLM: modificare il prompt invalida i risultati salvati
+PROMPT_VERSION = content_key(PROMPT_TEMPLATE).hex()[:12]
+
 def _extract_text_property(prop: dict) -> str:
     """Estrae plain text da una property Notion di tipo title/rich_text."""
     if not isinstance(prop, dict):
@@ -263,101 +317,38 @@ def _extract_status_name(prop: dict) -> str:
     return ""
 
 def normalize_text(text: str) -> str:
-    """Normalizza il testo con cache per evitare ricalcoli."""
-    if text in _text_normalization_cache:
-        return _text_normalization_cache[text]
+    """Normalizza il testo con cache LRU per evitare ricalcoli."""
+    key = content_key(text)
+    normalized = _text_normalization_cache.get(key)
+    if normalized is not None:
+        return normalized
     
     normalized = (text or "").lower()
     normalized = re.sub(r"https?://\S+", " ", normalized)
     normalized = re.sub(r"[\W_]+", " ", normalized, flags=re.UNICODE)
     normalized = re.sub(r"\s+", " ", normalized).strip()
     
-    # Cache per testi fino a 1000 caratteri (evita memory leak)
-    if len(text) <= 1000:
-        _text_normalization_cache[text] = normalized
-    
+    _text_normalization_cache.put(key, normalized)
     return normalized
 
-def _normalize_for_zone(text: str) -> str:
-    if not text:
-        return ""
-    # Rimuove accenti, minuscole, normalizza spazi e apostrofi
-    text = unicodedata.normalize("NFKD", text)
-    text = text.encode("ascii", "ignore").decode("ascii")
-    text = text.lower()
-    text = text.replace("'", " ")
-    text = re.sub(r"[\W_]+", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
 def infer_macro_zone(zona: str, titolo: str = "", descrizione: str = "") -> tuple[str, str]:
     """Mappa una zona/quartiere della città corrente in una macro-zona predefinita.
     Ritorna (macro_zone, zona_matched) se determinabile, altrimenti ("", "").
     Se non determinabile, restituisce stringa vuota.
-    Peso maggiore al match su 'zona', poi su titolo/descrizione.
+    Peso maggiore al match su 'zona', poi su titolo/descrizione (token su confini di parola).
     """
     zona_norm = _normalize_for_zone(zona)
-    titolo_norm = _normalize_for_zone(titolo)
-    descr_norm = _normalize_for_zone(descrizione)
-    corpus_norm = f"{titolo_norm} {descr_norm}".strip()
-
-    # Ottieni il mapping delle zone per la città corrente
-    zone_mapping = get_zone_mapping_for_city(CURRENT_CITY)
-    
-    best_macro = ""
-    best_score = 0
-    best_token = ""
-    for macro, tokens in zone_mapping.items():
-        score = 0
-        for token in tokens:
-            token = token.strip()
-            if not token:
-                continue
-            if zona_norm and token in zona_norm:
-                score += 2
-                if score > best_score:
-                    best_score = score
-                    best_macro = macro
-                    best_token = token
-            elif token in corpus_norm:
-                score += 1
-                if score > best_score:
-                    best_score = score
-                    best_macro = macro
-                    best_token = token
-        if score > best_score:
-            best_score = score
-            best_macro = macro
-
-    return (best_macro, best_token) if best_score > 0 else ("", "")
-
-def similarity_score(a: str, b: str) -> float:
-    """Calcola similarità con cache per evitare ricalcoli."""
-    # Crea una chiave unica per la coppia (ordinata per simmetria)
-    key = tuple(sorted([a, b]))
-    if key in _similarity_cache:
-        return _similarity_cache[key]
-    
-    a_norm, b_norm = normalize_text(a), normalize_text(b)
-    if not a_norm or not b_norm:
-        _similarity_cache[key] = 0.0
-        return 0.0
-    
-    # Evita confronti con testi troppo corti (meno di 10 caratteri)
-    if len(a_norm) < 10 or len(b_norm) < 10:
-        _similarity_cache[key] = 0.0
-        return 0.0
-    
-    # Calcola similarità usando token_set_ratio per maggiore accuratezza
-    score = fuzz.token_set_ratio(a_norm, b_norm) / 100.0
-    
-    # Bonus per testi molto simili in lunghezza
-    length_diff = abs(len(a_norm) - len(b_norm)) / max(len(a_norm), len(b_norm))
-    if length_diff < 0.1:  # Se la differenza di lunghezza è < 10%
-        score = min(score + 0.05, 1.0)  # Bonus del 5%
-    
-    _similarity_cache[key] = score
-    return score
+    corpus_norm = _normalize_for_zone(f"{titolo} {descrizione}")
+
+    best_macro, best_token = get_zone_index_for_city(CURRENT_CITY).best_macro(zona_norm, corpus_norm)
+    if best_macro:
+        return best_macro, best_token
+    # Zone classificate dal fallback AI nei run precedenti
+    if zona_norm:
+        learned = get_zone_memo().lookup(zona)
+        if learned:
+            return learned, zona_norm
+    return "", ""
 
 def safe_number(value):
     if value is None:
@@ -370,14 +361,66 @@ def safe_number(value):
     except Exception:
         return None
 
-def get_existing_data():
-    """Recupera tutti i dati esistenti dal database Notion in una sola chiamata ottimizzata."""
-    existing_links = set()
-    existing_pages = []
+def _page_to_record(page: dict) -> dict:
+    """Estrae da una pagina Notion i campi usati per esistenza e deduplicazione."""
+    props = page.get("properties", {})
+    image_url = props.get("images", {}).get("url")
+    return {
+        "id": page.get("id"),
+        "created_time": page.get("created_time"),
+        "last_edited_time": page.get("last_edited_time"),
+        "paraphrased_title": _extract_text_property(props.get("paraphrased_title", {})),
+        "original_description": _extract_text_property(props.get("original_description", {})),
+        "price": _extract_text_property(props.get("price", {})),
+        "zone": _extract_text_property(props.get("zone", {})),
+        "zone_macro": _extract_text_property(props.get("zone_macro", {})),
+        "status": _extract_status_name(props.get("status", {})),
+        "link": props.get("link", {}).get("url", "") or "",
+        "images": [image_url] if image_url else []
+    }
+
+def _slim_expired_record(record: dict) -> dict:
+    """Per le pagine scadute servono solo link e status (niente testi per la deduplicazione)."""
+    if record.get("status") != "expired":
+        return record
+    return {key: record.get(key) for key in ("id", "created_time", "last_edited_time", "status", "link")}
+
+def _get_property_ids(names: list) -> list:
+    """Mappa i nomi delle property negli ID richiesti da `filter_properties` (schema letto una volta per run).
+    Ritorna None se lo schema non è disponibile (la query scaricherà tutte le property).
+    """
+    global _notion_property_ids
+    if _notion_property_ids is None:
+        try:
+            response = http.get(
+                f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}",
+                headers=HEADERS_NOTION
+            )
+            if response.status_code != 200:
+                print(f"⚠️ Database schema unavailable, querying all properties: {response.text}")
+                _notion_property_ids = {}
+            else:
+                _notion_property_ids = {
+                    name: prop.get("id") for name, prop in response.json().get("properties", {}).items()
+                }
+        except Exception as e:
+            print(f"⚠️ Database schema error, querying all properties: {e}")
+            _notion_property_ids = {}
+    if not all(name in _notion_property_ids for name in names):
+        return None
+    return [_notion_property_ids[name] for name in names]
+
+def _query_database(query_filter: dict = None, properties: list = None):
+    """Scarica (paginando da 100) le pagine del database che soddisfano il filtro.
+    Se `properties` è indicato, il payload contiene solo quelle property (projection lato server).
+    Ritorna (records, completed): completed è False se la query si è interrotta per errore.
+    """
+    records = []
     has_more = True
     next_cursor = None
     
-    print("📋 Caricamento dati esistenti dal database...")
+    property_ids = _get_property_ids(properties) if properties else None
+    query_params = [("filter_properties", prop_id) for prop_id in property_ids] if property_ids else None
     
     while has_more:
         query_payload = {
@@ -389,51 +432,98 @@ def get_existing_data():
                 }
             ]
         }
+        if query_filter:
+            query_payload["filter"] = query_filter
         
         if next_cursor:
             query_payload["start_cursor"] = next_cursor
             
         try:
-            response = requests.post(
+            response = http.post(
                 f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}/query",
                 headers=HEADERS_NOTION,
+                params=query_params,
                 json=query_payload
             )
             
             if response.status_code != 200:
                 print(f"❌ Error retrieving existing data: {response.text}")
-                break
+                return records, False
                 
             data = response.json()
-            
-            for page in data.get("results", []):
-                props = page.get("properties", {})
-                
-                # Estrai link
-                link_prop = props.get("link", {})
-                link_url = link_prop.get("url", "")
-                if link_url:
-                    existing_links.add(link_url)
-                
-                # Estrai dati per deduplicazione
-                existing_pages.append({
-                    "id": page.get("id"),
-                    "created_time": page.get("created_time"),
-                            "paraphrased_title": _extract_text_property(props.get("paraphrased_title", {})),
-        "original_description": _extract_text_property(props.get("original_description", {})),
-        "price": _extract_text_property(props.get("price", {})),
-                    "zone": _extract_text_property(props.get("zone", {})),
-                    "status": _extract_status_name(props.get("status", {})),
-                    "link": link_url
-                })
+            records.extend(_slim_expired_record(_page_to_record(page)) for page in data.get("results", []))
             
             has_more = data.get("has_more", False)
             next_cursor = data.get("next_cursor")
             
         except Exception as e:
             print(f"❌ Error during data retrieval: {e}")
-            break
+            return records, False
     
+    return records, True
+
+def _fetch_all_pages():
+    """Scarica l'intero database. In modalità slim usa due query leggere: solo `link` per
+    tutte le pagine (controllo esistenza) e le property di deduplicazione solo per le pagine
+    non scadute (filtro status lato server).
+    Ritorna (records, completed).
+    """
+    if not NOTION_SLIM_QUERIES:
+        return _query_database()
+    
+    # Prima i link: una pagina creata tra le due query risulta comunque attiva
+    link_records, links_completed = _query_database(properties=LINK_PROPERTIES)
+    active_records, active_completed = _query_database(ACTIVE_PAGES_FILTER, DEDUP_PROPERTIES)
+    
+    # Le pagine presenti solo nella query dei link sono quelle scadute
+    records = list(active_records)
+    active_ids = {r["id"] for r in active_records}
+    for record in link_records:
+        if record["id"] not in active_ids:
+            record["status"] = "expired"
+            records.append(_slim_expired_record(record))
+    print(f"📋 Slim query: {len(active_records)} active pages with dedup fields, {len(records) - len(active_records)} expired pages with link only")
+    return records, active_completed and links_completed
+
+def get_existing_data():
+    """Recupera i dati esistenti dal database Notion.
+    Con lo snapshot locale scarica solo le pagine modificate dopo l'ultimo watermark;
+    ogni NOTION_FULL_SYNC_HOURS esegue una riconciliazione completa (per le pagine cancellate).
+    """
+    print("📋 Caricamento dati esistenti dal database...")
+    
+    if not NOTION_INCREMENTAL_SYNC:
+        existing_pages, _ = _fetch_all_pages()
+    else:
+        snapshot = NotionSnapshot(NOTION_SNAPSHOT_FILE).load()
+        if snapshot.needs_full_sync(NOTION_FULL_SYNC_HOURS):
+            print(f"🔄 Full Notion sync (snapshot missing or older than {NOTION_FULL_SYNC_HOURS}h)...")
+            records, completed = _fetch_all_pages()
+            if completed:
+                snapshot.replace_all(records)
+                snapshot.save()
+                existing_pages = snapshot.records()
+            else:
+                # Sync completa fallita: non toccare lo snapshot, usa quello che abbiamo
+                print("⚠️ Full sync incomplete, snapshot not updated")
+                snapshot.merge(records)
+                existing_pages = snapshot.records()
+        else:
+            print(f"🔄 Incremental Notion sync (pages edited since {snapshot.watermark})...")
+            # Nessun filtro di status qui: servono anche le pagine appena diventate "expired"
+            records, completed = _query_database({
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": snapshot.watermark}
+            }, DEDUP_PROPERTIES if NOTION_SLIM_QUERIES else None)
+            new_count = snapshot.merge(records)
+            print(f"📋 {len(records)} changed pages ({new_count} new) merged into local snapshot")
+            if completed:
+                snapshot.save()
+            else:
+                print("⚠️ Incremental sync incomplete, snapshot not updated")
+            existing_pages = snapshot.records()
+    
+    existing_links = {p["link"] for p in existing_pages if p.get("link")}
     print(f"📋 Found {len(existing_links)} links and {len(existing_pages)} existing pages")
     
     # Debug: mostra alcuni link esistenti per verificare
@@ -443,37 +533,90 @@ def get_existing_data():
     
     return existing_links, existing_pages
 
-def find_best_duplicate_optimized(existing_pages: list, new_descr: str, threshold: float = 0.8):
-    """Versione ottimizzata che ferma la ricerca quando trova un match sopra la soglia."""
-    best_page = None
-    best_score = 0.0
+def _best_matches(pages: list, new_descrs_norm: list, threshold: float) -> list:
+    """Confronta tutte le nuove descrizioni con tutte le pagine (già ordinate dalla più recente)
+    in un'unica matrice. Per ogni descrizione sceglie la pagina più recente sopra la soglia,
+    altrimenti quella col punteggio più alto.
+    """
+    pages = [p for p in pages if p.get("original_description")]
+    if not pages or not new_descrs_norm:
+        return [(None, 0.0)] * len(new_descrs_norm)
     
-    # Pre-normalizza la nuova descrizione una sola volta
-    new_descr_norm = normalize_text(new_descr)
+    # Usa la descrizione normalizzata precalcolata (memo), se presente
+    choices = [p.get("_normalized_desc") or normalize_text(p["original_description"]) for p in pages]
+    best_idx, best_scores = pick_best_matches(similarity_matrix(new_descrs_norm, choices), threshold)
+    return [
+        (pages[i], float(score)) if score > 0 else (None, 0.0)
+        for i, score in zip(best_idx, best_scores)
+    ]
+
+def _dedup_block_key(item: dict) -> tuple:
+    """Chiave di blocking (macro-zona, fascia di prezzo) di una pagina o di un post.
+    Usa i campi calcolati da enrich_listing o la zone_macro già nota, altrimenti la inferisce;
+    None dove il dato manca.
+    """
+    features = item.get("_features")
+    if features is not None:
+        return features.block_key
+    zone_macro = item.get("zone_macro") or infer_macro_zone(
+        item.get("zone", ""),
+        titolo=item.get("paraphrased_title", ""),
+        descrizione=item.get("original_description", "")
+    )[0]
+    return (zone_macro or None, price_band(item.get("price", "")))
+
+def find_best_duplicates_batch(candidate_index: DedupCandidateIndex, features: list, threshold: float = 0.8,
+                               blocks: list = None, new_images: list = None) -> list:
+    """Deduplicazione batch: ritorna (best_page, best_score) per ogni nuova descrizione,
+    data come ListingFeatures (descrizione normalizzata, token e impronta già calcolati).
+    Le descrizioni identiche o quasi identiche a una pagina attiva sono risolte dalle impronte
+    (hash esatto / SimHash), i post con `new_images` in comune con una pagina attiva dall'indice
+    delle immagini; le altre passano al confronto fuzzy.
+    Se l'indice ha un LSH confronta solo l'unione dei candidati MinHash, altrimenti tutte le pagine attive.
+    Con `blocks` (una chiave di blocking per descrizione) ogni descrizione è confrontata
+    solo con i candidati del proprio bucket.
+    """
+    new_descrs_norm = [f.normalized_desc for f in features]
+    tokens_list = [f.tokens for f in features]
+    results = [candidate_index.fingerprint_match(f.normalized_desc, f.tokens, f.fingerprint) for f in features]
+    if new_images is not None:
+        results = [match if match[0] is not None else candidate_index.image_match(images)
+                   for match, images in zip(results, new_images)]
+    pending = [i for i, (page, _) in enumerate(results) if page is None]
     
-    # Ordina le pagine per data di creazione (più recenti prima) per trovare duplicati più velocemente
-    sorted_pages = sorted(existing_pages, key=lambda x: x.get("created_time", ""), reverse=True)
+    scored = 0
+    if pending and blocks is not None and candidate_index.block_key is not None:
+        for i in pending:
+            pages = candidate_index.candidates([tokens_list[i]], block=blocks[i])
+            scored += len(pages)
+            results[i] = _best_matches(pages, [new_descrs_norm[i]], threshold)[0]
+    elif pending:
+        pages = candidate_index.candidates([tokens_list[i] for i in pending])
+        scored = len(pages) * len(pending)
+        for i, match in zip(pending, _best_matches(pages, [new_descrs_norm[i] for i in pending], threshold)):
+            results[i] = match
+    candidate_index.record_comparisons(len(new_descrs_norm), scored)
     
-    for p in sorted_pages:
-        descr = p.get("original_description", "")
-        if not descr:
-            continue
-            
-        # Normalizza anche la descrizione esistente per confronto accurato
-        descr_norm = normalize_text(descr)
-        
-        # Calcola similarità usando testi normalizzati per maggiore accuratezza
-        score = similarity_score(new_descr_norm, descr_norm)
-        
-        if score > best_score:
-            best_score = score
-            best_page = p
-            
-            # Early exit: se abbiamo trovato un match molto forte, fermiamoci
-            if score >= threshold:
-                break
+    if DEDUP_RECALL_CHECK and (candidate_index.lsh is not None or candidate_index.block_key is not None):
+        # Verifica di recall: confronta le decisioni con la scansione completa
+        brute_results = _best_matches(candidate_index.pages(), new_descrs_norm, threshold)
+        for (_, score), (_, brute_score) in zip(results, brute_results):
+            candidate_index.record_recall(brute_score >= threshold, score >= threshold)
     
-    return best_page, best_score
+    return results
+
+def find_best_duplicate_optimized(existing_pages, features: ListingFeatures, threshold: float = 0.8,
+                                  block: tuple = None, images: list = None):
+    """Miglior duplicato per una singola descrizione (vedi find_best_duplicates_batch).
+    `existing_pages` può essere un DedupCandidateIndex o una lista di pagine.
+    """
+    if not isinstance(existing_pages, DedupCandidateIndex):
+        existing_pages = DedupCandidateIndex(existing_pages)
+    return find_best_duplicates_batch(
+        existing_pages, [features], threshold,
+        blocks=[block] if block is not None else None,
+        new_images=[images] if images is not None else None
+    )[0]
 
 def extract_images_from_description(description):
     """Estrae gli URL delle immagini dal contenuto HTML della descrizione"""
@@ -554,68 +697,201 @@ def extract_all_images(entry):
     return all_images
 
 
-def clear_caches():
-    """Pulisce le cache in memoria per evitare memory leak."""
-    global _similarity_cache, _text_normalization_cache
-    
-    # Mantieni solo le ultime 1000 entry per evitare memory leak
-    if len(_similarity_cache) > 1000:
-        _similarity_cache.clear()
-    if len(_text_normalization_cache) > 1000:
-        _text_normalization_cache.clear()
-
-
-
 def mark_status_expired(page_id: str):
     url = f"https://api.notion.com/v1/pages/{page_id}"
     payload = {"properties": {"status": {"select": {"name": "expired"}}}}
-    res = requests.patch(url, headers=HEADERS_NOTION, json=payload)
+    try:
+        res = http.patch(url, headers=HEADERS_NOTION, json=payload)
+    except Exception as e:
+        print(f"❌ Error updating status=expired for {page_id}: {e}")
+        return
     if res.status_code != 200:
         print(f"❌ Error updating status=expired for {page_id}: {res.text}")
     else:
         print(f"🗂️ Set status=expired for page {page_id}")
 
+def fetch_page_fields(page_id: str):
+    """Campi estratti dal modello di una pagina esistente (per riusarli su una ripubblicazione).
+    Ritorna None se la pagina non è leggibile."""
+    try:
+        res = http.get(f"https://api.notion.com/v1/pages/{page_id}", headers=HEADERS_NOTION)
+    except Exception as e:
+        print(f"❌ Error reading page {page_id}: {e}")
+        return None
+    if res.status_code != 200:
+        print(f"❌ Error reading page {page_id}: {res.text}")
+        return None
+    props = res.json().get("properties", {})
+    fields = {key: _extract_text_property(props.get(key, {}))
+              for key in ("paraphrased_title", "overview", "price", "zone", "zone_macro", "rooms", "rating_reason")}
+    fields["reliability"] = props.get("reliability", {}).get("number")
+    return fields
+
+def replace_duplicate_page(candidate_index: DedupCandidateIndex, old_page: dict, new_item: dict) -> bool:
+    """Crea la pagina per la ripubblicazione di un annuncio (già arricchito, vedi enrich_listing),
+    marca expired quella vecchia e aggiorna l'indice dei candidati. Ritorna False se la creazione fallisce."""
+    new_page_id = send_to_notion(new_item)
+    if not new_page_id:
+        print("⚠️ New page creation failed, skip duplicate marking")
+        return False
+    # Marca la pagina esistente come scaduta
+    old_page_id = old_page.get("id")
+    mark_status_expired(old_page_id)
+    # Aggiorna l'indice in RAM per non riproporlo (O(1) per id)
+    candidate_index.expire(old_page_id)
+    
+    # Aggiungi la nuova pagina alla lista per deduplicazione futura
+    candidate_index.add(_new_page_record(new_page_id, new_item))
+    return True
+
+def _new_page_record(page_id: str, item: dict) -> dict:
+    """Pagina appena creata nel formato dell'indice dei candidati, con i campi derivati dell'item."""
+    features = item["_features"]
+    return {
+        "id": page_id,
+        "created_time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "paraphrased_title": item.get("paraphrased_title", ""),
+        "original_description": item.get("original_description", ""),
+        "price": item.get("price", ""),
+        "zone": item.get("zone", ""),
+        "zone_macro": features.zone_macro,
+        "status": "",
+        "link": item.get("link", ""),
+        "images": item.get("images", []),
+        "_normalized_desc": features.normalized_desc,
+        "_tokens": features.tokens,
+        "_fingerprint": features.fingerprint,
+        "_features": features
+    }
 
+def text_features(text: str, description_memo: DescriptionMemo,
+                  candidate_index: DedupCandidateIndex) -> ListingFeatures:
+    """Campi derivati dalla sola descrizione: testo normalizzato, token e impronta."""
+    normalized, tokens = description_memo.get(text)
+    fingerprint = None
+    if candidate_index.fingerprints is not None and normalized:
+        fingerprint = candidate_index.fingerprints.fingerprint(normalized, tokens)
+    return ListingFeatures(normalized, tokens, fingerprint)
+
+def enrich_listing(item: dict, description_memo: DescriptionMemo, candidate_index: DedupCandidateIndex,
+                   base: ListingFeatures = None) -> ListingFeatures:
+    """Stadio di arricchimento: calcola una sola volta per post descrizione normalizzata, token,
+    impronta, prezzo e macro-zona e li allega all'item in `_features`, letti poi da deduplicazione
+    e send_to_notion. `base` riusa i campi testuali già calcolati per la stessa descrizione.
+    """
+    descr = item.get("original_description", "")
+    base = base or text_features(descr, description_memo, candidate_index)
+    zone_macro, zone_matched = infer_macro_zone(
+        item.get("zone", ""),
+        titolo=item.get("paraphrased_title", ""),
+        descrizione=descr
+    )
+    features = replace(base, price=parse_price(item.get("price", "")), zone_macro=zone_macro, zone_matched=zone_matched)
+    item["_features"] = features
+    return features
+
+def dedup_before_llm(posts: list, candidate_index: DedupCandidateIndex, description_memo: DescriptionMemo):
+    """Deduplicazione prima del modello: i post che ripubblicano con certezza un annuncio attivo
+    sostituiscono la pagina esistente riusandone i campi estratti, senza chiamata LLM.
+    Ritorna (post da mandare al modello, pagine sostituite).
+
+    "Con certezza" vuol dire testo identico o quasi identico (impronta esatta o SimHash) e
+    nessuna differenza di prezzo: una ripubblicazione con un nuovo prezzo o simile solo al
+    confronto fuzzy passa dal modello e dalla sostituzione post-LLM, che usa i campi appena
+    estratti. Lo stesso vale per chi riusa soltanto le foto di un annuncio attivo."""
+    if not posts or not len(candidate_index) or candidate_index.fingerprints is None:
+        return posts, 0
+    
+    remaining = []
+    replaced = 0
+    for post in posts:
+        # Le pagine salvano la descrizione censurata: confronta lo stesso testo
+        text = censor_sensitive_data(post["summary"])
+        features = text_features(text, description_memo, candidate_index)
+        # Le pagine già sostituite da un post precedente non sono più nell'indice
+        best_page, best_score = candidate_index.fingerprint_match(
+            features.normalized_desc, features.tokens, features.fingerprint
+        )
+        if not best_page or best_score < PRE_LLM_DUP_THRESHOLD:
+            remaining.append(post)
+            continue
+        fields = fetch_page_fields(best_page["id"])
+        if fields is None:
+            remaining.append(post)
+            continue
+        if parse_price(post["summary"]) != parse_price(fields.get("price", "")):
+            print(f"💶 Repost with a different price, sending to the model: {post['title'][:50]}...")
+            remaining.append(post)
+            continue
+        print(f"♻️ Repost of active listing (score: {best_score:.3f}), skipping LLM: {post['title'][:50]}...")
+        new_item = dict(fields, original_description=text, link=post["link"],
+                        images=post.get("images") or best_page.get("images", []))
+        new_features = enrich_listing(new_item, description_memo, candidate_index, base=features)
+        if not new_features.zone_macro and fields.get("zone_macro"):
+            # Macro-zona assegnata alla pagina dal fallback AI: non si può dedurre di nuovo, si conserva
+            new_item["_features"] = replace(new_features, zone_macro=fields["zone_macro"], zone_matched="")
+        if replace_duplicate_page(candidate_index, best_page, new_item):
+            replaced += 1
+        else:
+            remaining.append(post)
+    return remaining, replaced
 
 
 
-def parse_llm_json(raw_text, retries=3):
-    """Tenta di parsare JSON da testo grezzo con retry."""
-    for attempt in range(retries):
-        raw_text = raw_text.strip()
-        if not raw_text:
-            print(f"⚠️ Empty response. Retry {attempt+1}/{retries}")
-            time.sleep(2 ** attempt)
-            continue
-        try:
-            return json.loads(raw_text)
-        except json.JSONDecodeError:
-            print(f"⚠️ Invalid JSON. Retry {attempt+1}/{retries}")
-            time.sleep(2 ** attempt)
-    return None
-
-def ai_macro_zone_from_zone(zona_text: str) -> str:
-    """Chiede al modello di mappare una zona/quartiere alla macro-zona predefinita.
-    Ritorna stringa vuota se non determinabile o risposta non valida.
+
+
+def parse_llm_json(raw_text):
+    """JSON della risposta del modello (tollera blocchi ```json, testo attorno e virgole finali)."""
+    parsed = extract_json(raw_text)
+    if parsed is None:
+        print("⚠️ Invalid JSON in model response")
+    return parsed
+
+def parse_llm_items(raw_text, posts_batch: list) -> list:
+    """Risultati del modello allineati ai post del batch, con None per i post senza un elemento valido.
+
+    Gli elementi ben formati vengono recuperati anche se il resto della risposta è malformato
+    o troncato; si abbinano ai post per link se il modello lo riporta, altrimenti per posizione.
     """
-    if not zona_text:
-        return ""
+    items = [item if isinstance(item, dict) and "relevant_listing" in item else None
+             for item in salvage_array(raw_text)]
+    if not any(items):
+        print("⚠️ No valid results in model response")
+        return [None] * len(posts_batch)
+    
+    positions = {post.get("link"): i for i, post in enumerate(posts_batch)}
+    valid = [item for item in items if item is not None]
+    if all(item.get("link") in positions for item in valid):
+        aligned = [None] * len(posts_batch)
+        for item in valid:
+            aligned[positions[item["link"]]] = item
+        return aligned
+    return (items + [None] * len(posts_batch))[:len(posts_batch)]
+
+def ai_macro_zones_from_zones(zones: list) -> dict | None:
+    """Chiede al modello, con un unico prompt, la macro-zona di più zone/quartieri.
+    Ritorna {zona: macro-zona} solo per le zone a cui il modello ha risposto, con stringa vuota
+    se non l'ha saputa classificare o ha risposto fuori lista; None se la chiamata o il parsing falliscono.
+    """
+    if not zones:
+        return {}
     
     # Ottieni le macro-zone per la città corrente
     macro_zones = get_macro_zones_for_city(CURRENT_CITY)
     city_display_name = CITY_CONFIG.display_name if CITY_CONFIG else "la città"
     
     macro_list = "\n- " + "\n- ".join(macro_zones)
+    zone_list = json.dumps(zones, ensure_ascii=False)
     prompt = f"""
-Ti fornisco una zona/quartiere di {city_display_name}. Scegli quale macro-zona corrisponde, SOLO tra questa lista. Se non sei sicuro, restituisci stringa vuota.
+Ti fornisco una lista di zone/quartieri di {city_display_name}. Per ognuna scegli quale macro-zona corrisponde, SOLO tra questa lista. Se non sei sicuro, usa stringa vuota.
 Lista macro-zone consentite:{macro_list}
 
-Rispondi SOLO in JSON, nel formato:
+Rispondi SOLO in JSON, con un oggetto che ha come chiavi le zone esattamente come fornite:
 {{
-          "zone_macro": "<una delle macro-zone sopra oppure \"\" se incerto>"
+          "<zona>": "<una delle macro-zone sopra oppure \"\" se incerto>"
 }}
 
-ZONA: {zona_text}
+ZONE: {zone_list}
 """
     payload = {
         "model": MODEL_NAME,
@@ -625,31 +901,29 @@ ZONA: {zona_text}
         ]
     }
     try:
-        r = requests.post(
+        r = http.post(
             "https://openrouter.ai/api/v1/chat/completions",
             headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type": "application/json"},
             json=payload
         )
         if r.status_code != 200:
             print(f"❌ AI macro-zone error: {r.text}")
-            return ""
+            return None
         content = r.json()["choices"][0]["message"]["content"]
         parsed = parse_llm_json(content)
         if not isinstance(parsed, dict):
-            return ""
-        # Tolleranza su chiave/maiuscole
-        key = None
-        for k in parsed.keys():
-            if k.lower() == "zone_macro":
-                key = k
-                break
-        if not key:
-            return ""
-        value = str(parsed.get(key) or "").strip()
-        return value if value in macro_zones else ""
+            return None
+        # Tolleranza su maiuscole/accenti delle chiavi restituite
+        by_norm = {_normalize_for_zone(str(k)): str(v or "").strip() for k, v in parsed.items()}
+        result = {}
+        for zone in zones:
+            value = by_norm.get(_normalize_for_zone(zone))
+            if value is not None:
+                result[zone] = value if value in macro_zones else ""
+        return result
     except Exception as e:
         print(f"❌ AI macro-zone call error: {e}")
-        return ""
+        return None
 
 def send_to_notion(data):
     """Invia i dati a Notion. Restituisce l'ID pagina se creato, altrimenti None."""
@@ -658,13 +932,12 @@ def send_to_notion(data):
     descr = data.get("original_description", "")
     prezzo = data.get("price", "")
     zona = data.get("zone", "")
-    zona_macro_result = infer_macro_zone(
-        zona,
-        titolo=titolo,
-        descrizione=descr
-    )
-    zona_macro = zona_macro_result[0]  # Estrai solo la macro-zona
-    zona_matched = zona_macro_result[1]  # Zona che ha causato il match
+    # Macro-zona calcolata dallo stadio di arricchimento (enrich_listing), se presente
+    features = data.get("_features")
+    if features is not None:
+        zona_macro, zona_matched = features.zone_macro, features.zone_matched
+    else:
+        zona_macro, zona_matched = infer_macro_zone(zona, titolo=titolo, descrizione=descr)
     if zona_macro:
         print(f"🗺️ Zona_macro '{zona_macro}' dedotta da '{zona_matched}' per zona '{zona}'")
     camere = data.get("rooms", "")
@@ -702,7 +975,12 @@ def send_to_notion(data):
         "parent": {"database_id": NOTION_DATABASE_ID},
         "properties": properties
     }
-    res = requests.post("https://api.notion.com/v1/pages", headers=HEADERS_NOTION, json=payload)
+    try:
+        # Creazione non idempotente: si ritentano solo i 429, non timeout e 5xx
+        res = http.post("https://api.notion.com/v1/pages", headers=HEADERS_NOTION, json=payload, idempotent=False)
+    except Exception as e:
+        print(f"❌ Notion add error: {e}")
+        return None
     if res.status_code != 200:
         print(f"❌ Notion add error: {res.text}")
         return None
@@ -712,66 +990,171 @@ def send_to_notion(data):
         print(f"✅ Added to Notion: {data['paraphrased_title']} ({page_id})")
         return page_id
 
-def call_openrouter(posts_batch, max_retries=3):
-    """Chiama il modello OpenRouter per un batch di post con retry e backoff dinamico."""
+def call_openrouter(posts_batch):
+    """Chiama il modello OpenRouter per un batch di post.
+    Retry, backoff e circuit breaker sono gestiti dal client HTTP (vedi http_client.RetryPolicy).
+    """
     payload = {
         "model": MODEL_NAME,
         "messages": [
             {"role": "system", "content": "Sei un assistente che filtra e analizza annunci immobiliari."},
-            {"role": "user", "content": PROMPT_TEMPLATE.format(posts=json.dumps(posts_batch, ensure_ascii=False))}
+            {"role": "user", "content": PROMPT_TEMPLATE.format(
+                posts=json.dumps([llm_prompt_post(post) for post in posts_batch], ensure_ascii=False))}
         ]
     }
     
-    current_backoff = INITIAL_BACKOFF_SECONDS
+    try:
+        r = http.post(
+            "https://openrouter.ai/api/v1/chat/completions",
+            headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type": "application/json"},
+            json=payload
+        )
+    except CircuitOpenError as e:
+        print(f"⛔ OpenRouter unavailable, skip: {e}")
+        return None
+    except Exception as e:
+        print(f"❌ OpenRouter call error: {e}")
+        return None
     
-    for attempt in range(max_retries):
-        try:
-            r = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type": "application/json"},
-                json=payload
-            )
+    if r.status_code != 200:
+        print(f"❌ OpenRouter API error ({r.status_code}): {r.text}")
+        return None
+    
+    try:
+        return r.json()["choices"][0]["message"]["content"]
+    except Exception as e:
+        print(f"❌ Unexpected OpenRouter response: {e}")
+        return None
+
+def llm_prompt_post(post: dict) -> dict:
+    """Versione del post inviata al modello: testo troncato a LLM_MAX_SUMMARY_CHARS e al massimo
+    LLM_MAX_PROMPT_IMAGES immagini. Il post originale resta invariato."""
+    summary = post.get("summary", "")
+    if len(summary) > LLM_MAX_SUMMARY_CHARS:
+        cut = summary.rfind(" ", 0, LLM_MAX_SUMMARY_CHARS)
+        summary = summary[:cut if cut > 0 else LLM_MAX_SUMMARY_CHARS] + " [...]"
+    return dict(post, summary=summary, images=post.get("images", [])[:LLM_MAX_PROMPT_IMAGES])
+
+def estimate_post_tokens(post: dict) -> int:
+    """Token di prompt stimati per un post (≈4 caratteri per token, JSON compreso)."""
+    return len(json.dumps(llm_prompt_post(post), ensure_ascii=False)) // 4 + 1
+
+def estimate_llm_tokens(posts_batch) -> int:
+    """Stima dei token di prompt e risposta di un batch, per il bucket TPM."""
+    return (len(PROMPT_TEMPLATE) // 4 + sum(estimate_post_tokens(post) for post in posts_batch)
+            + LLM_OUTPUT_TOKENS_PER_POST * len(posts_batch))
+
+def pack_batches(posts: list) -> list:
+    """Divide i post (nell'ordine) in batch il più pieni possibile entro LLM_PROMPT_TOKEN_BUDGET
+    (prompt + post) e LLM_OUTPUT_TOKEN_BUDGET (risposta stimata). Ogni batch ha almeno un post."""
+    base_tokens = len(PROMPT_TEMPLATE) // 4
+    max_posts = max(LLM_OUTPUT_TOKEN_BUDGET // LLM_OUTPUT_TOKENS_PER_POST, 1)
+    batches = []
+    current, current_tokens = [], base_tokens
+    for post in posts:
+        tokens = estimate_post_tokens(post)
+        if current and (current_tokens + tokens > LLM_PROMPT_TOKEN_BUDGET or len(current) >= max_posts):
+            batches.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(post)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def get_llm_dispatcher() -> LLMDispatcher:
+    """Dispatcher condiviso tra i feed, così i limiti di rate valgono per l'intero run."""
+    global _llm_dispatcher
+    if _llm_dispatcher is None:
+        _llm_dispatcher = LLMDispatcher(
+            call_openrouter,
+            max_in_flight=LLM_MAX_IN_FLIGHT,
+            requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+            estimate_tokens=estimate_llm_tokens,
+            is_available=lambda: not http.circuit_open("openrouter.ai")
+        )
+    return _llm_dispatcher
+
+def llm_cache_key(post: dict) -> str:
+    """Chiave della cache LLM: titolo e testo normalizzati, modello e versione del prompt."""
+    text = "\x00".join((MODEL_NAME, PROMPT_VERSION, normalize_text(post.get("title", "")),
+                        normalize_text(post.get("summary", ""))))
+    return content_key(text).hex()
+
+def analyze_posts(posts: list, dispatcher: LLMDispatcher, feed_number: int):
+    """Manda i post al modello in batch riempiti fino al budget di token (più batch in volo) e
+    ritorna, nell'ordine, (batch, risultato parsato). Un batch fallito viene ritentato dimezzandone
+    la dimensione fino a MIN_BATCH; un singolo post che fallisce ancora viene saltato.
+    I post già analizzati (cache LLM) sono restituiti per primi in un unico batch senza chiamate."""
+    llm_cache = get_llm_cache() if LLM_RESULT_CACHE else None
+    if llm_cache is not None:
+        keys = {id(post): llm_cache_key(post) for post in posts}
+        cached_posts, cached_items, misses = [], [], []
+        for post in posts:
+            item = llm_cache.get(keys[id(post)])
+            if item is None:
+                misses.append(post)
+            else:
+                cached_posts.append(post)
+                cached_items.append(item)
+        if cached_posts:
+            print(f"💾 {len(cached_posts)} posts already analyzed (LLM cache), {len(misses)} sent to the model")
+            yield cached_posts, cached_items
+        posts = misses
+    
+    batches = pack_batches(posts)
+    if batches:
+        print(f"📦 {len(posts)} posts packed into {len(batches)} LLM requests")
+    for batch, response_text in dispatcher.map_ordered(batches):
+        if http.circuit_open("openrouter.ai"):
+            # Provider in errore: inutile ritentare con batch più piccoli
+            print(f"⛔ OpenRouter circuit open, {len(batch)} posts left for the next run")
+            continue
+        print(f"📦 Processing batch of {len(batch)} posts (feed {feed_number})...")
+        todo = deque([batch])
+        first_attempt = True
+        while todo:
+            current_batch = todo.popleft()
+            if not first_attempt:
+                print(f"📦 Processing batch of {len(current_batch)} posts (feed {feed_number})...")
+                response_text = dispatcher.call(current_batch)
+            first_attempt = False
             
-            if r.status_code == 429:
-                print(f"⏳ Rate limit reached (attempt {attempt + 1}/{max_retries}), waiting {current_backoff} seconds...")
-                time.sleep(current_backoff)
-                # Aumenta il backoff per il prossimo tentativo
-                current_backoff = MAX_BACKOFF_SECONDS
+            # Se response_text è None, potrebbe essere dovuto a rate limiting
+            items = parse_llm_items(response_text, current_batch) if response_text is not None \
+                else [None] * len(current_batch)
+            done = [(post, item) for post, item in zip(current_batch, items) if item is not None]
+            missing = [post for post, item in zip(current_batch, items) if item is None]
+            if done:
+                if llm_cache is not None:
+                    for post, item in done:
+                        llm_cache.put(keys[id(post)], item)
+                yield [post for post, _ in done], [item for _, item in done]
+            if not missing:
                 continue
-            elif r.status_code != 200:
-                print(f"❌ OpenRouter API error: {r.text}")
-                # Aumenta il backoff per il prossimo tentativo
-                current_backoff = MAX_BACKOFF_SECONDS
-                return None
-            
-            data = r.json()
-            return data["choices"][0]["message"]["content"]
-            
-        except Exception as e:
-            print(f"❌ OpenRouter call error (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                print(f"⏳ Waiting {current_backoff} seconds before retry...")
-                time.sleep(current_backoff)
-                # Aumenta il backoff per il prossimo tentativo
-                current_backoff = MAX_BACKOFF_SECONDS
-    
-            print(f"❌ Failed after {max_retries} attempts")
-    return None
+            if http.circuit_open("openrouter.ai"):
+                break
+            if done:
+                # Risultati parziali: si rimandano solo i post senza risposta valida
+                print(f"🩹 Salvaged {len(done)}/{len(current_batch)} results, resubmitting {len(missing)} posts")
+                todo.appendleft(missing)
+            elif len(missing) > MIN_BATCH:
+                half = max(len(missing) // 2, MIN_BATCH)
+                print(f"↪ Retry reducing batch to {half}")
+                todo.appendleft(missing[half:])
+                todo.appendleft(missing[:half])
+            else:
+                print("⚠️ Batch impossible to process, skip.")
 
 def process_rss():
     """Scarica e processa i post RSS da multiple feed."""
     
-    # Inizializza sempre la cache (crea file vuoto se non esiste)
+    # Inizializza la cache degli scartati (snapshot JSON + eventuale log non compattato)
     print("🔧 Inizializzazione cache...")
-    initial_cache = load_rejected_cache()
-    if not os.path.exists(CACHE_FILE):
-        save_rejected_cache(initial_cache)
-        print(f"✅ Cache file initialized: {os.path.abspath(CACHE_FILE)}")
-    else:
-        # Aggiorna sempre il timestamp per assicurarsi che Git rilevi cambiamenti
-        initial_cache['timestamp'] = datetime.now().isoformat()
-        save_rejected_cache(initial_cache)
-        print(f"✅ Cache file updated: {os.path.abspath(CACHE_FILE)}")
+    store = get_rejected_store()
+    mode = "write-behind" if REJECTED_CACHE_WRITE_BEHIND else "write-through"
+    print(f"✅ Rejected cache ready: {CACHE_FILE} (backend: {REJECTED_CACHE_BACKEND}, {mode}, {len(store.urls)} URLs)")
     
     # Recupera tutti i dati esistenti in una sola chiamata ottimizzata
     print("📋 Loading existing data from database...")
@@ -779,15 +1162,29 @@ def process_rss():
     active_pages = [p for p in existing_pages if p.get("status") != "expired"]
     print(f"📋 Loaded {len(active_pages)} active pages for deduplication")
     
+    # Normalizza le descrizioni esistenti una sola volta, riusando il memo del run precedente
+    description_memo = get_description_memo()
+    description_memo.prepare_pages(active_pages)
+    print(f"📋 {description_memo.describe()}")
+    
+    # Indice dei candidati (più recenti prima, con LSH) costruito una sola volta per run
+    # e aggiornato man mano che le pagine vengono aggiunte o marcate expired
+    candidate_index = DedupCandidateIndex(
+        active_pages,
+        lsh=MinHashLSHIndex() if DEDUP_USE_LSH else None,
+        block_key=_dedup_block_key if DEDUP_BLOCKING else None,
+        fingerprints=FingerprintIndex() if DEDUP_FINGERPRINTS else None,
+        images=ImageFingerprintIndex() if DEDUP_IMAGE_INDEX else None
+    )
+    if candidate_index.lsh is not None:
+        print(f"📋 {candidate_index.lsh.describe()}")
+    
     # Carica cache degli URL scartati
     cache_count, avg_age, oldest_age = get_cache_stats()
     print(f"📋 Rejected URLs cache: {cache_count} URLs in memory")
     if cache_count > 0:
         print(f"   📊 Average age: {avg_age:.1f}h, Oldest: {oldest_age:.1f}h")
     
-    # Lista dinamica per i nuovi post aggiunti (per deduplicazione intra-batch)
-    newly_added_pages = []
-    
     total_new_posts = 0
     total_rejected = 0
     
@@ -859,50 +1256,39 @@ def process_rss():
             continue
             
         print(f"⏳ Parsing RSS feed {i}... Found {len(posts)} new posts to process")
-
-        batch_size = MAX_BATCH
-        idx = 0
-        new_posts_added = 0
         
-        while idx < len(posts):
-            current_batch = posts[idx: idx + batch_size]
-            print(f"📦 Processing batch of {len(current_batch)} posts (feed {i})...")
-            response_text = call_openrouter(current_batch)
-            
-            # Se response_text è None, potrebbe essere dovuto a rate limiting
-            if response_text is None:
-                if batch_size > MIN_BATCH:
-                    batch_size -= 1
-                    print(f"↪ Retry reducing batch to {batch_size}")
-                    continue
-                else:
-                    print("⚠️ Batch impossible to process, skip.")
-                    idx += 1
-                    batch_size = MAX_BATCH
-                    continue
-            
-            parsed = parse_llm_json(response_text)
-            if not parsed:
-                if batch_size > MIN_BATCH:
-                    batch_size -= 1
-                    print(f"↪ Retry reducing batch to {batch_size}")
-                    continue
-                else:
-                    print("⚠️ Batch impossible to process, skip.")
-                    idx += 1
-                    batch_size = MAX_BATCH
+        if RELEVANCE_PREFILTER:
+            kept_posts = []
+            prefilter = get_relevance_prefilter()
+            for post in posts:
+                reason = prefilter.check(post)
+                if reason is None:
+                    kept_posts.append(post)
                     continue
+                print(f"🚫 Post rejected by local prefilter ({reason}): {post['title'][:50]}")
+                add_to_rejected_cache(post["link"], reason)
+                total_rejected += 1
+            posts = kept_posts
+        
+        new_posts_added = 0
+        if DEDUP_BEFORE_LLM:
+            posts, reposts_replaced = dedup_before_llm(posts, candidate_index, description_memo)
+            new_posts_added += reposts_replaced
+            if reposts_replaced:
+                print(f"♻️ {reposts_replaced} reposts resolved without LLM, {len(posts)} posts left for the model")
 
+        for current_batch, parsed in analyze_posts(posts, get_llm_dispatcher(), i):
             # Se parsed è una lista di risultati
             if isinstance(parsed, list):
-                # Combina pagine esistenti + nuove pagine aggiunte per deduplicazione completa
-                all_active_pages = active_pages + newly_added_pages
-                
                 # Lista temporanea per i post rilevanti del batch corrente
                 relevant_posts = []
                 
                 # Prima passata: raccogli tutti i post rilevanti del batch
                 for post_data, original_post in zip(parsed, current_batch):
+                    if _relevance_prefilter is not None:
+                        _relevance_prefilter.record_llm_decision(
+                            original_post["link"], post_data.get("relevant_listing") == "YES"
+                        )
                     if post_data.get("relevant_listing") == "YES":
                         post_data["link"] = original_post["link"]
                         # Censura i dati sensibili dalla descrizione pulita (solo per post rilevanti)
@@ -924,39 +1310,44 @@ def process_rss():
                 
                 # Seconda passata: deduplicazione intra-batch e inserimento
                 
-                # Pre-calcola le descrizioni normalizzate per ottimizzazione
-                relevant_posts_with_norm = []
-                for post_data in relevant_posts:
-                    new_descr = post_data.get("original_description", "")
-                    post_data["_normalized_desc"] = normalize_text(new_descr)
-                    relevant_posts_with_norm.append(post_data)
+                # Stadio di arricchimento: campi derivati calcolati una sola volta per post
+                batch_norms = [enrich_listing(post_data, description_memo, candidate_index).normalized_desc
+                               for post_data in relevant_posts]
                 
-                # Controllo duplicati intra-batch prima di tutto (più veloce)
+                # Controllo duplicati intra-batch prima di tutto: una sola matrice batch × batch
+                intra_scores = similarity_matrix(batch_norms, batch_norms)
                 unique_posts = []
-                for post_data in relevant_posts_with_norm:
-                    new_descr = post_data.get("original_description", "")
-                    new_descr_norm = post_data["_normalized_desc"]
-                    
-                    # Controlla duplicati solo con i post già processati in questo batch
-                    is_duplicate = False
-                    for existing_post in unique_posts:
-                        existing_descr_norm = existing_post["_normalized_desc"]
-                        if similarity_score(new_descr_norm, existing_descr_norm) >= HIGH_DUP_THRESHOLD:
-                            print(f"🔄 Intra-batch duplicate detected, skip: {post_data.get('paraphrased_title', '')[:50]}...")
-                            is_duplicate = True
-                            break
-                    
-                    if not is_duplicate:
-                        unique_posts.append(post_data)
+                unique_idx = []
+                for j, post_data in enumerate(relevant_posts):
+                    # Controlla duplicati solo con i post già tenuti in questo batch
+                    if any(intra_scores[j, i] >= HIGH_DUP_THRESHOLD for i in unique_idx):
+                        print(f"🔄 Intra-batch duplicate detected, skip: {post_data.get('paraphrased_title', '')[:50]}...")
+                        continue
+                    unique_idx.append(j)
+                    unique_posts.append(post_data)
                 
                 print(f"📦 Batch reduced from {len(relevant_posts)} to {len(unique_posts)} unique posts")
                 
+                # Controlla duplicati con pagine esistenti per tutto il batch in un'unica chiamata
+                batch_matches = find_best_duplicates_batch(
+                    candidate_index,
+                    [post_data["_features"] for post_data in unique_posts],
+                    HIGH_DUP_THRESHOLD,
+                    blocks=[post_data["_features"].block_key for post_data in unique_posts] if DEDUP_BLOCKING else None,
+                    new_images=[post_data.get("images", []) for post_data in unique_posts]
+                )
+                
                 # Ora processa solo i post unici
-                for post_data in unique_posts:
-                    new_descr = post_data.get("original_description", "")
+                for post_data, (best_page, best_score) in zip(unique_posts, batch_matches):
+                    features = post_data["_features"]
                     
-                    # Controlla duplicati con pagine esistenti
-                    best_page, best_score = find_best_duplicate_optimized(all_active_pages, new_descr, HIGH_DUP_THRESHOLD)
+                    # Se la pagina trovata è stata appena sostituita da un altro post del batch, ricalcola
+                    if best_page and best_page.get("status") == "expired":
+                        best_page, best_score = find_best_duplicate_optimized(
+                            candidate_index, features, HIGH_DUP_THRESHOLD,
+                            block=features.block_key if DEDUP_BLOCKING else None,
+                            images=post_data.get("images", [])
+                        )
                     
                     # Log per debug deduplicazione
                     if best_score > 0.7:  # Log solo per score alti
@@ -967,48 +1358,19 @@ def process_rss():
                         print(f"🔄 Duplicate with existing page detected (score: {best_score:.3f}), replacing...")
                         new_item = {
                             "paraphrased_title": post_data.get("paraphrased_title", ""),
-                            "original_description": new_descr,
+                            "original_description": post_data.get("original_description", ""),
                             "price": post_data.get("price", ""),
                             "zone": post_data.get("zone", ""),
-                                    "zone_macro": infer_macro_zone(
-            post_data.get("zone", ""),
-            titolo=post_data.get("paraphrased_title", ""),
-            descrizione=new_descr
-        )[0],  # Estrai solo la macro-zona
+                            "zone_macro": features.zone_macro,
                             "rating_reason": post_data.get("rating_reason", ""),
                             "reliability": post_data.get("reliability", None),
                             "overview": post_data.get("overview", ""),
                             "images": post_data.get("images", []),
                             "link": post_data.get("link", ""),
+                            "_features": features,
                         }
-                        # Crea la nuova pagina
-                        new_page_id = send_to_notion(new_item)
-                        if new_page_id:
-                            # Marca la pagina esistente come scaduta
-                            old_page_id = best_page.get("id")
-                            mark_status_expired(old_page_id)
-                            # Aggiorna cache in RAM per non riproporlo
-                            for p in all_active_pages:
-                                if p.get("id") == old_page_id:
-                                    p["status"] = "expired"
-                                    break
-                            
-                            # Aggiungi la nuova pagina alla lista per deduplicazione futura
-                            new_page_data = {
-                                "id": new_page_id,
-                                "created_time": time.strftime("%Y-%m-%dT%H:%M:%S"),
-                                "paraphrased_title": new_item.get("paraphrased_title", ""),
-                                "original_description": new_item.get("original_description", ""),
-                                "price": new_item.get("price", ""),
-                                "zone": new_item.get("zone", ""),
-                                "zone_macro": new_item.get("zone_macro", ""),
-                                "status": "",
-                                "link": new_item.get("link", "")
-                            }
-                            newly_added_pages.append(new_page_data)
+                        if replace_duplicate_page(candidate_index, best_page, new_item):
                             new_posts_added += 1
-                        else:
-                            print("⚠️ New page creation failed, skip duplicate marking")
                     else:
                         # Nessun duplicato forte: inseriamo normalmente
                         page_id = send_to_notion(post_data)
@@ -1016,60 +1378,53 @@ def process_rss():
                             new_posts_added += 1
                             # Se abbiamo una Zona ma non siamo riusciti a inferire una Zona_macro, tentiamo in coda con AI
                             zona = post_data.get("zone", "")
-                            zona_macro_result = infer_macro_zone(
-                                zona,
-                                titolo=post_data.get("paraphrased_title", ""),
-                                descrizione=post_data.get("original_description", "")
-                            )
-                            zona_macro = zona_macro_result[0]
-                            zona_matched = zona_macro_result[1]
-                            if zona_macro:
-                                print(f"🗺️ Zone_macro '{zona_macro}' inferred from '{zona_matched}' for zone '{zona}'")
-                            if zona and not zona_macro:
+                            if zona and not features.zone_macro:
                                 all_added_posts_for_ai.append({
                                     "page_id": page_id,
                                     "zona": zona
                                 })
                             # Aggiungi alla lista per confronti successivi
-                            new_page_data = {
-                                "id": page_id,
-                                "created_time": time.strftime("%Y-%m-%dT%H:%M:%S"),
-                                "paraphrased_title": post_data.get("paraphrased_title", ""),
-                                "original_description": post_data.get("original_description", ""),
-                                "price": post_data.get("price", ""),
-                                "zone": post_data.get("zone", ""),
-                                "zone_macro": zona_macro,
-                                "status": "",
-                                "link": post_data.get("link", "")
-                            }
-                            newly_added_pages.append(new_page_data)
+                            candidate_index.add(_new_page_record(page_id, post_data))
                         else:
                             print("⚠️ Creazione pagina fallita")
             else:
                 print("⚠️ Risultato inatteso dal modello.")
 
-            idx += batch_size
-            batch_size = MAX_BATCH
-            # Assicura che ci siano sempre almeno INITIAL_BACKOFF_SECONDS tra le richieste
-            print(f"⏳ Waiting {INITIAL_BACKOFF_SECONDS} seconds before next batch...")
-            time.sleep(INITIAL_BACKOFF_SECONDS)
-
         print(f"🎉 Processing completed for feed {i}! Added {new_posts_added} new listings.")
         total_new_posts += new_posts_added
 
-    # Fallback AI GLOBALE: per tutti i post aggiunti con Zona presente ma senza Zona_macro dedotta
+    # Fallback AI GLOBALE: per tutti i post aggiunti con Zona presente ma senza Zona_macro dedotta.
+    # Prima il memo delle zone già classificate, poi un solo prompt per le zone ancora sconosciute
     if all_added_posts_for_ai:
         print(f"🧠 GLOBAL AI macro-zone fallback for {len(all_added_posts_for_ai)} new listings without Zone_macro...")
+        zone_memo = get_zone_memo()
+        # Una sola zona per chiave normalizzata: "Gràcia", "gracia" e "GRACIA " sono la stessa domanda
+        # (il memo usa la stessa normalizzazione, quindi la risposta vale per tutte le varianti)
+        unknown_by_key = {}
+        for item in all_added_posts_for_ai:
+            zona_key = _normalize_for_zone(item["zona"])
+            if zona_key not in ("", "n a") and zona_key not in unknown_by_key and zone_memo.lookup(item["zona"]) is None:
+                unknown_by_key[zona_key] = item["zona"]
+        unknown_zones = sorted(unknown_by_key.values())
+        for start in range(0, len(unknown_zones), ZONE_FALLBACK_BATCH):
+            chunk = unknown_zones[start: start + ZONE_FALLBACK_BATCH]
+            print(f"🧠 Asking the model for {len(chunk)} unknown zones in one request...")
+            answers = ai_macro_zones_from_zones(chunk)
+            if answers is None:
+                # Errore di rete o risposta illeggibile: nessuna risposta da ricordare, si riprova al prossimo run
+                continue
+            for zona_txt, ai_macro in answers.items():
+                zone_memo.learn(zona_txt, ai_macro)
+        
         for item in all_added_posts_for_ai:
             page_id = item["page_id"]
-            zona_txt = item["zona"]
-            ai_macro = ai_macro_zone_from_zone(zona_txt)
+            ai_macro = zone_memo.lookup(item["zona"])
             if ai_macro:
                 # aggiorna la pagina Notion con Zona_macro
                 try:
                     url = f"https://api.notion.com/v1/pages/{page_id}"
                     payload = {"properties": {"zone_macro": {"rich_text": [{"text": {"content": ai_macro}}]}}}
-                    r = requests.patch(url, headers=HEADERS_NOTION, json=payload)
+                    r = http.patch(url, headers=HEADERS_NOTION, json=payload)
                     if r.status_code == 200:
                         print(f"✅ Zone_macro updated via AI → {ai_macro} for {page_id}")
                     else:
@@ -1085,19 +1440,36 @@ def process_rss():
     print(f"   📋 Cache: {final_cache_count} URLs in memory (average age: {final_avg_age:.1f}h)")
     print(f"   🧠 AI Total Rejected: {total_rejected_ever} posts since inception")
     
-    # Pulisci le cache in memoria per evitare memory leak
-    clear_caches()
-    print(f"   🧹 In-memory caches cleared")
-    
-    # Statistiche performance
-    print(f"   ⚡ Performance: Similarity cache: {len(_similarity_cache)} calculations, Text cache: {len(_text_normalization_cache)} normalizations")
-    
-    # Verifica finale del file cache
-    if os.path.exists(CACHE_FILE):
-        file_size = os.path.getsize(CACHE_FILE)
-        print(f"   ✅ File cache: {CACHE_FILE} ({file_size} bytes)")
-    else:
-        print(f"   ❌ Cache file NOT found: {CACHE_FILE}")
+    # Statistiche performance (le cache LRU sono limitate, non serve svuotarle)
+    print(f"   ⚡ Performance: {_text_normalization_cache.describe()}")
+    print(f"   ⚡ Performance: {description_memo.describe()}")
+    if candidate_index.lsh is not None:
+        print(f"   ⚡ Performance: {candidate_index.lsh.describe()}")
+    if candidate_index.fingerprints is not None:
+        print(f"   ⚡ Performance: {candidate_index.fingerprints.describe()}")
+    if candidate_index.images is not None:
+        print(f"   ⚡ Performance: {candidate_index.images.describe()}")
+    print(f"   ⚡ Performance: {candidate_index.describe()}")
+    if _llm_dispatcher is not None:
+        print(f"   ⚡ Performance: {_llm_dispatcher.describe()}")
+    if _llm_cache is not None:
+        print(f"   ⚡ Performance: {_llm_cache.describe()}")
+    if _relevance_prefilter is not None:
+        print(f"   ⚡ Performance: {_relevance_prefilter.describe()}")
+    print(f"   ⚡ Performance: {get_zone_index_for_city(CURRENT_CITY).describe()}")
+    if _zone_memo is not None:
+        print(f"   ⚡ Performance: {_zone_memo.describe()}")
+    for line in http.describe().splitlines():
+        print(f"   🌐 HTTP: {line}")
 
 if __name__ == "__main__":
-    process_rss()
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    try:
+        process_rss()
+    finally:
+        # Compatta sempre le cache su disco, anche se il run si interrompe
+        flush_rejected_cache()
+        flush_description_memo()
+        flush_llm_cache()
+        flush_prefilter_stats()
+        flush_zone_memo()
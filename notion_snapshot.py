@@ -0,0 +1,84 @@
+# notion_snapshot.py
+# Snapshot locale delle pagine Notion per la sincronizzazione incrementale
+#
+# Ogni run scarica solo le pagine con `last_edited_time` successivo al watermark
+# e le fonde nello snapshot; una riconciliazione completa periodica (che
+# sostituisce l'intero snapshot) intercetta le pagine cancellate/archiviate.
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from json_store import save_json_atomic
+
+
+class NotionSnapshot:
+    """Pagine del database indicizzate per id, con watermark e data dell'ultima sync completa."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pages: Dict[str, dict] = {}
+        self.watermark: Optional[str] = None
+        self.last_full_sync: Optional[str] = None
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.pages = data.get('pages', {})
+                self.watermark = data.get('watermark')
+                self.last_full_sync = data.get('last_full_sync')
+            except Exception as e:
+                print(f"⚠️ Notion snapshot loading error: {e}")
+                self.pages = {}
+                self.watermark = None
+                self.last_full_sync = None
+        return self
+
+    def needs_full_sync(self, max_age_hours: float) -> bool:
+        """True se non c'è uno snapshot valido o l'ultima riconciliazione è troppo vecchia."""
+        if not self.watermark or not self.last_full_sync:
+            return True
+        try:
+            last_full = datetime.fromisoformat(self.last_full_sync)
+        except ValueError:
+            return True
+        return datetime.now() - last_full > timedelta(hours=max_age_hours)
+
+    def _advance_watermark(self, records: List[dict]):
+        edited = [r["last_edited_time"] for r in records if r.get("last_edited_time")]
+        if edited:
+            # I timestamp Notion sono ISO UTC con lo stesso formato: il confronto lessicografico è corretto
+            latest = max(edited)
+            if not self.watermark or latest > self.watermark:
+                self.watermark = latest
+
+    def replace_all(self, records: List[dict]):
+        """Riconciliazione completa: lo snapshot diventa esattamente il risultato della query."""
+        self.pages = {r["id"]: r for r in records}
+        self.watermark = None
+        self._advance_watermark(records)
+        self.last_full_sync = datetime.now().isoformat()
+
+    def merge(self, records: List[dict]) -> int:
+        """Fonde le pagine modificate dopo il watermark. Ritorna il numero di pagine nuove."""
+        added = 0
+        for record in records:
+            if record["id"] not in self.pages:
+                added += 1
+            self.pages[record["id"]] = record
+        self._advance_watermark(records)
+        return added
+
+    def records(self) -> List[dict]:
+        """Copie delle pagine (chi le usa può annotarle senza sporcare lo snapshot)."""
+        return [dict(page) for page in self.pages.values()]
+
+    def save(self):
+        save_json_atomic(self.path, {
+            'watermark': self.watermark,
+            'last_full_sync': self.last_full_sync,
+            'pages': self.pages
+        }, "Notion snapshot", separators=(",", ":"))
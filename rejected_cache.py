@@ -0,0 +1,253 @@
+# rejected_cache.py
+# Store persistente per gli URL scartati dall'AI.
+#
+# Il file JSON `rejected_urls_cache_<city>.json` resta lo snapshot "ufficiale"
+# (viene committato dal workflow e letto da scripts/fetch_notion.js per il
+# contatore totale). I backend disponibili sono:
+#   - "json": comportamento storico, riscrive l'intero snapshot a ogni inserimento
+#   - "log":  append-only log (`<snapshot>.log`, una riga JSON per inserimento)
+#             compattato nello snapshot solo con flush()
+#
+# In modalità write-behind gli inserimenti restano solo in memoria e vengono
+# scritti con un'unica flush() atomica (file temporaneo + rename) a fine run o
+# ogni `flush_every` nuovi inserimenti.
+
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from json_store import write_json_atomic
+
+
+class RejectedUrlStore(ABC):
+    """Stato in memoria degli URL scartati; la persistenza è delegata alle sottoclassi.
+
+    Gli URL sono tenuti in un OrderedDict in ordine di inserimento (il più vecchio
+    in testa), con il timestamp epoch `ts` in ogni entry: scadenza TTL ed eviction
+    FIFO rimuovono dalla testa in O(1) ammortizzato, senza ordinamenti, e le
+    statistiche sono mantenute in modo incrementale.
+    """
+
+    def __init__(self, snapshot_file: str, ttl_hours: int = 48, max_size: int = 1000,
+                 write_behind: bool = False, flush_every: int = 0):
+        self.snapshot_file = snapshot_file
+        self.ttl_hours = ttl_hours
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_size = max_size
+        self.write_behind = write_behind
+        self.flush_every = flush_every
+        self.urls: "OrderedDict[str, dict]" = OrderedDict()
+        self.total_rejected_count = 0
+        self._ts_sum = 0.0
+        self._loaded = False
+        self._pending = 0
+
+    # --- Caricamento -------------------------------------------------------
+
+    def load(self):
+        """Carica lo snapshot (una sola volta per processo) e rimuove gli URL scaduti."""
+        if self._loaded:
+            return self
+        self._loaded = True
+
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._import_entries(data.get('urls', {}))
+                self.total_rejected_count = data.get('total_rejected_count', 0)
+            except Exception as e:
+                print(f"⚠️ Cache loading error: {e}")
+
+        self._after_load()
+
+        expired = self._expire(time.time())
+        if expired:
+            print(f"🗑️ Removed {expired} expired URLs from cache (TTL {self.ttl_hours}h)")
+        return self
+
+    def _import_entries(self, urls: dict):
+        """Costruisce l'indice dallo snapshot; l'ISO viene parsato solo per i file legacy senza `ts`."""
+        entries = []
+        for url, url_data in urls.items():
+            ts = url_data.get('ts')
+            if ts is None:
+                ts = datetime.fromisoformat(url_data['timestamp']).timestamp()
+            entries.append((url, url_data.get('reason', ''), url_data['timestamp'], ts))
+        # Gli snapshot scritti da questo store sono già in ordine; i file legacy vengono ordinati una volta
+        if any(entries[i][3] > entries[i + 1][3] for i in range(len(entries) - 1)):
+            entries.sort(key=lambda e: e[3])
+        self.urls = OrderedDict()
+        self._ts_sum = 0.0
+        for url, reason, timestamp, ts in entries:
+            self.urls[url] = {'reason': reason, 'timestamp': timestamp, 'ts': ts}
+            self._ts_sum += ts
+
+    def _after_load(self):
+        """Hook per i backend che devono ricostruire lo stato oltre lo snapshot."""
+
+    def _pop_oldest(self):
+        _, entry = self.urls.popitem(last=False)
+        self._ts_sum -= entry['ts']
+
+    def _expire(self, now: float) -> int:
+        """Rimuove dalla testa gli URL più vecchi del TTL."""
+        cutoff = now - self.ttl_seconds
+        expired = 0
+        while self.urls and next(iter(self.urls.values()))['ts'] < cutoff:
+            self._pop_oldest()
+            expired += 1
+        return expired
+
+    # --- Operazioni --------------------------------------------------------
+
+    def contains(self, url: str) -> bool:
+        entry = self.urls.get(url)
+        return entry is not None and entry['ts'] >= time.time() - self.ttl_seconds
+
+    def add(self, url: str, reason: str = "AI_SCRUTINY", timestamp: Optional[str] = None) -> bool:
+        """Aggiunge/aggiorna un URL. Ritorna True se l'URL non era già in cache."""
+        added_at = datetime.fromisoformat(timestamp) if timestamp else datetime.now()
+        is_new_url = self._apply_add(url, reason, added_at.isoformat(), added_at.timestamp())
+        if self.write_behind:
+            # Nessun accesso al disco: si scrive solo al raggiungimento della soglia
+            self._pending += 1
+            if self.flush_every and self._pending >= self.flush_every:
+                self.flush()
+        else:
+            self._persist_add(url, self.urls[url])
+        return is_new_url
+
+    def _apply_add(self, url: str, reason: str, timestamp: str, ts: float) -> bool:
+        self._expire(ts)
+        is_new_url = url not in self.urls
+        if not is_new_url:
+            # Un URL ri-scartato torna in coda (LRU)
+            self._ts_sum -= self.urls.pop(url)['ts']
+
+        # Se la cache è piena, rimuovi l'URL più vecchio (FIFO)
+        while len(self.urls) >= self.max_size:
+            self._pop_oldest()
+
+        self.urls[url] = {'reason': reason, 'timestamp': timestamp, 'ts': ts}
+        self._ts_sum += ts
+        if is_new_url:
+            self.total_rejected_count += 1
+        return is_new_url
+
+    @abstractmethod
+    def _persist_add(self, url: str, entry: dict):
+        """Rende persistente un nuovo inserimento (fuori dalla modalità write-behind)."""
+
+    def stats(self) -> Tuple[int, float, float]:
+        """Ritorna (numero URL, età media in ore, età massima in ore)."""
+        now = time.time()
+        self._expire(now)
+        if not self.urls:
+            return 0, 0, 0
+        count = len(self.urls)
+        avg_age = (now - self._ts_sum / count) / 3600
+        oldest_age = (now - next(iter(self.urls.values()))['ts']) / 3600
+        return count, avg_age, oldest_age
+
+    def snapshot(self) -> dict:
+        return {
+            'urls': self.urls,
+            'total_rejected_count': self.total_rejected_count,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def _write_snapshot(self):
+        # Scrittura atomica: un run interrotto non lascia mai uno snapshot troncato
+        write_json_atomic(self.snapshot_file, self.snapshot(), indent=2)
+        self._pending = 0
+
+    def flush(self):
+        """Scrive lo snapshot completo su disco."""
+        try:
+            self._write_snapshot()
+        except Exception as e:
+            print(f"⚠️ Cache save error: {e}")
+
+
+class JsonRejectedStore(RejectedUrlStore):
+    """Backend storico: riscrive lo snapshot JSON a ogni inserimento."""
+
+    def _persist_add(self, url: str, entry: dict):
+        self.flush()
+
+
+class AppendLogRejectedStore(RejectedUrlStore):
+    """Backend append-only: ogni inserimento è una riga in `<snapshot>.log`.
+
+    Il log viene rigiocato sopra lo snapshot al caricamento e svuotato da flush(),
+    che riscrive lo snapshot una volta sola (tipicamente a fine run).
+    """
+
+    def __init__(self, snapshot_file: str, ttl_hours: int = 48, max_size: int = 1000,
+                 write_behind: bool = False, flush_every: int = 0):
+        super().__init__(snapshot_file, ttl_hours, max_size, write_behind, flush_every)
+        self.log_file = f"{snapshot_file}.log"
+
+    def _after_load(self):
+        if not os.path.exists(self.log_file):
+            return
+        replayed = 0
+        try:
+            with open(self.log_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Riga troncata da un'interruzione: la ignoriamo
+                        continue
+                    ts = record.get('ts')
+                    if ts is None:
+                        ts = datetime.fromisoformat(record['timestamp']).timestamp()
+                    self._apply_add(record['url'], record.get('reason', ''), record['timestamp'], ts)
+                    replayed += 1
+        except Exception as e:
+            print(f"⚠️ Cache log replay error: {e}")
+        if replayed:
+            print(f"📜 Replayed {replayed} entries from {self.log_file}")
+
+    def _persist_add(self, url: str, entry: dict):
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'url': url, **entry}, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"⚠️ Cache log append error: {e}")
+
+    def flush(self):
+        """Compatta il log nello snapshot JSON e lo svuota."""
+        try:
+            self._write_snapshot()
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+        except Exception as e:
+            print(f"⚠️ Cache save error: {e}")
+
+
+REJECTED_STORE_BACKENDS = {
+    "json": JsonRejectedStore,
+    "log": AppendLogRejectedStore,
+}
+
+
+def create_rejected_store(snapshot_file: str, backend: str = "log",
+                          ttl_hours: int = 48, max_size: int = 1000,
+                          write_behind: bool = False, flush_every: int = 0) -> RejectedUrlStore:
+    """Crea lo store per il backend richiesto (fallback su "log" se sconosciuto)."""
+    store_cls = REJECTED_STORE_BACKENDS.get((backend or "").lower())
+    if store_cls is None:
+        print(f"⚠️ Unknown rejected cache backend '{backend}', using 'log'")
+        store_cls = AppendLogRejectedStore
+    return store_cls(snapshot_file, ttl_hours=ttl_hours, max_size=max_size,
+                     write_behind=write_behind, flush_every=flush_every)
@@ -0,0 +1,204 @@
+# relevance_prefilter.py
+# Prefiltro locale di rilevanza prima della chiamata LLM
+#
+# Scarta senza chiamare il modello i post evidentemente non rilevanti: chi CERCA una
+# stanza ("cerco stanza", "busco habitación", "looking for a room") e gli affitti
+# turistici a notte. Ogni regola ha un peso: i segnali di offerta ("affittasi",
+# "se alquila", "looking for a flatmate") pesano in negativo, e si scarta solo sopra
+# la soglia. I casi incerti vanno comunque al modello.
+#
+# Una piccola frazione dei post che verrebbero scartati (shadow) viene mandata
+# comunque al modello: il confronto con le sue decisioni, accumulato tra i run,
+# stima precision e recall del prefiltro.
+
+import json
+import os
+import re
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from json_store import save_json_atomic
+
+REASON_SEEKER = "PREFILTER_SEEKER"
+REASON_VACATION = "PREFILTER_VACATION"
+
+# Oggetti di un annuncio di alloggio, per lingua (testo senza accenti, minuscolo)
+_HOUSING = {
+    "en": r"(?:room|double room|single room|flat|apartment|studio|place to (?:stay|live)|accommodation|house ?share|flat ?share)",
+    "es": r"(?:habitacion|piso|apartamento|alojamiento|estudio|cuarto|vivienda)",
+    "ca": r"(?:habitacio|pis|apartament|allotjament|estudi)",
+    "it": r"(?:stanza|camera|posto letto|appartamento|monolocale|bilocale|alloggio|casa)",
+}
+# Importo prima di "a notte" ("50€/night", "40 euros por noche"): fuori da un prezzo "a night" è
+# spesso altro ("a night owl", "a night bus")
+_NIGHT_PRICE = r"\d[\d.,]*\s*(?:€|£|\$|eur(?:os?)?|gbp)?\s*"
+# Fino a due parole tra verbo e oggetto ("cerco una stanza singola", "looking for a double room")
+_GAP = r"(?:\s+\w+){0,2}?\s+"
+# Le regole di chi cerca valgono solo in prima persona o a inizio frase, e non come domanda:
+# "perfect for anyone looking for a room" e "Looking for a room? Double room in..." sono offerte
+_SENTENCE_START = r"(?:^\s*|[.!?:]\s*)"
+_NOT_QUESTION = r"\b(?!\s*\?)"
+
+# (regex, peso, motivo): peso positivo = segnale di scarto, negativo = segnale di offerta
+_RULES: Dict[str, List[Tuple[str, float, Optional[str]]]] = {
+    "en": [
+        (rf"(?:{_SENTENCE_START}|\b(?:i am|i'm|im|we are|we're|i|we) (?:currently |still )?)"
+         rf"(?:looking|searching|hunting) for{_GAP}{_HOUSING['en']}{_NOT_QUESTION}", 2.0, REASON_SEEKER),
+        (rf"\b(?:need|seeking|want)(?:\s+\w+)?\s+(?:a |an )?{_HOUSING['en']}\b", 1.5, REASON_SEEKER),
+        (r"\b(?:i am|i'm|im|we are|we're) (?:a |an )?\d{2}\s?(?:y/?o|years? old)\b", 1.0, REASON_SEEKER),
+        (r"\b(?:my|our) (?:max(?:imum)? )?budget\b", 1.0, REASON_SEEKER),
+        (r"\b(?:moving|relocating) to\b", 0.5, REASON_SEEKER),
+        (rf"{_NIGHT_PRICE}(?:per |a |/ ?)night\b|\bnightly\b|\bholiday (?:let|rental)\b|\bairbnb\b", 2.0, REASON_VACATION),
+        (rf"\b{_HOUSING['en']} (?:available|for rent|to let|to rent)\b", -2.0, None),
+        (r"\bavailable (?:from|now|immediately|on)\b", -1.0, None),
+        (r"\b(?:looking for|seeking|need) (?:a |an |\w+ )?(?:flat ?mate|room ?mate|house ?mate|tenant|lodger)s?\b", -2.0, None),
+        (r"\b(?:anyone|someone|those|people|whoever)(?: who (?:is|are))?(?: currently)? (?:looking|searching|hunting) for\b"
+         r"|\bare you (?:looking|searching|hunting) for\b", -2.0, None),
+        (rf"\b(?:looking|searching|hunting) for{_GAP}{_HOUSING['en']}\s*\?", -2.0, None),
+        (r"(?:\b(?:per|a) |/ ?)(?:month|week)\b|\bpcm\b|\bpw\b", -1.0, None),
+    ],
+    "es": [
+        (rf"\b(?:busco|buscamos|necesito|necesitamos){_GAP}{_HOUSING['es']}{_NOT_QUESTION}", 2.0, REASON_SEEKER),
+        (r"\b(?:mi|nuestro) presupuesto\b|\bpresupuesto maximo\b", 1.0, REASON_SEEKER),
+        (r"\b(?:tengo|tenemos) \d{2} anos\b", 1.0, REASON_SEEKER),
+        (rf"{_NIGHT_PRICE}(?:por |la |/ ?)noche\b|\balquiler vacacional\b|\bnoches? minim[oa]s?\b", 2.0, REASON_VACATION),
+        (r"\bse alquila\b|\balquilo\b|\bse busca inquilin[oa]\b", -2.0, None),
+        (r"\b(?:busco|buscamos|buscando) (?:una? )?(?:companer[oa]s?|inquilin[oa]s?|chic[oa]s?)\b", -2.0, None),
+        (r"¿\s*(?:buscas|buscais|buscando|necesitas)\b|\bsi (?:buscas|estas buscando)\b"
+         r"|\bpara (?:quien|quienes|alguien que|los que|las que|personas que) (?:busca|buscan)\b", -2.0, None),
+        (r"\bdisponible (?:desde|a partir|ya|inmediatamente)\b", -1.0, None),
+        (r"(?:\b(?:al|por) |/ ?)mes\b|\bmensuales?\b", -1.0, None),
+    ],
+    "ca": [
+        (rf"\b(?:busco|busquem|necessito){_GAP}{_HOUSING['ca']}{_NOT_QUESTION}", 2.0, REASON_SEEKER),
+        (rf"{_NIGHT_PRICE}(?:per |/ ?)nit\b", 2.0, REASON_VACATION),
+        (r"\bes lloga\b|\blloguem\b|\blloguo\b", -2.0, None),
+        (r"\bper a (?:qui|qualsevol que) (?:busca|busqui)\b|\bsi busques\b", -2.0, None),
+        (r"(?:\b(?:al|per) |/ ?)mes\b", -1.0, None),
+    ],
+    "it": [
+        (rf"(?:\b(?:cerco|cerchiamo)|\b(?:sto|stiamo) cercando|\b(?:sono|siamo) in cerca di)"
+         rf"{_GAP}{_HOUSING['it']}{_NOT_QUESTION}", 2.0, REASON_SEEKER),
+        (r"\b(?:il mio|il nostro) budget\b|\bbudget (?:massimo|max)\b", 1.0, REASON_SEEKER),
+        (r"\b(?:ho|abbiamo) \d{2} anni\b", 1.0, REASON_SEEKER),
+        (rf"{_NIGHT_PRICE}(?:a |per |/ ?)notte\b|\baffitt[oi] brev[ei]\b|\bcasa vacanz[ae]\b", 2.0, REASON_VACATION),
+        (r"\baffittasi\b|\baffitto (?:una? )?(?:stanza|camera|posto letto)\b|\bsi affitta\b", -2.0, None),
+        (r"\b(?:cerco|cerchiamo|cercando|in cerca di) (?:una? )?(?:coinquilin[oaie]|inquilin[oaie]|ragazz[oaie]|studentess[ae]|student[ie])\b", -2.0, None),
+        (r"\b(?:per|a) (?:chi|coloro che|chiunque) (?:cerca|cercano|e in cerca)\b"
+         r"|\bcerchi (?:una? )?(?:stanza|camera|casa|alloggio|posto letto)\b", -2.0, None),
+        (r"\bdisponibile (?:da|dal|subito)\b|\blibera da\b", -1.0, None),
+        (r"(?:\bal |/ ?)mese\b|\bmensili\b", -1.0, None),
+    ],
+}
+
+
+def _fold(text: str) -> str:
+    """Minuscolo senza accenti, spazi compattati."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text.lower())
+
+
+class RelevancePrefilter:
+    """Regole compilate una volta per le lingue della città (l'inglese è sempre incluso)."""
+
+    def __init__(self, languages: List[str] = None, reject_score: float = 2.0, shadow_rate: float = 0.1,
+                 stats_file: str = None):
+        languages = list(dict.fromkeys((languages or []) + ["en"]))
+        self.languages = [lang for lang in languages if lang in _RULES]
+        self.reject_score = reject_score
+        self.shadow_rate = shadow_rate
+        self.stats_file = stats_file
+        self._rules = [(re.compile(pattern), weight, reason)
+                       for lang in self.languages for pattern, weight, reason in _RULES[lang]]
+        self._shadowed: Dict[str, str] = {}
+        # Post passati con qualche segnale di scarto ma sotto soglia: i soli che il prefiltro
+        # avrebbe potuto scartare, quindi i soli che contano come mancati se il modello li scarta
+        self._flagged: Dict[str, str] = {}
+        self.rejected = 0
+        self.passed = 0
+        # Confronto con le decisioni del modello (cumulativo tra i run se stats_file è indicato)
+        self.stats = {"shadow_agree": 0, "shadow_disagree": 0, "flagged_missed": 0, "passed_relevant": 0}
+
+    def score(self, title: str, text: str) -> Tuple[float, Optional[str]]:
+        """Punteggio di scarto e motivo prevalente (None se nessuna regola di scarto scatta)."""
+        folded = _fold(f"{title}\n{text}")
+        total = 0.0
+        by_reason: Dict[str, float] = {}
+        for pattern, weight, reason in self._rules:
+            if pattern.search(folded):
+                total += weight
+                if reason is not None:
+                    by_reason[reason] = by_reason.get(reason, 0.0) + weight
+        reason = max(by_reason, key=by_reason.get) if by_reason else None
+        return total, reason
+
+    def _in_shadow_sample(self, link: str) -> bool:
+        # Campione deterministico per link: lo stesso post ha sempre la stessa sorte
+        return (zlib.crc32(link.encode("utf-8")) % 10000) < self.shadow_rate * 10000
+
+    def check(self, post: dict) -> Optional[str]:
+        """Motivo di scarto se il post è scartato con certezza, altrimenti None (va al modello).
+        I post del campione shadow non vengono scartati ma ricordati per il confronto."""
+        score, reason = self.score(post.get("title", ""), post.get("summary", ""))
+        link = post.get("link", "")
+        if reason is None or score < self.reject_score:
+            if reason is not None and score > 0:
+                self._flagged[link] = reason
+            self.passed += 1
+            return None
+        if self._in_shadow_sample(link):
+            self._shadowed[link] = reason
+            self.passed += 1
+            return None
+        self.rejected += 1
+        return reason
+
+    def record_llm_decision(self, link: str, relevant: bool):
+        """Registra la decisione del modello su un post passato dal prefiltro.
+        Un post scartato dal modello conta come mancato solo se il prefiltro lo aveva segnalato
+        (punteggio positivo su una regola seeker/vacanza): un annuncio di divano non è un errore
+        delle regole."""
+        if link in self._shadowed:
+            self.stats["shadow_agree" if not relevant else "shadow_disagree"] += 1
+        elif relevant:
+            self.stats["passed_relevant"] += 1
+        elif link in self._flagged:
+            self.stats["flagged_missed"] += 1
+
+    def load_stats(self):
+        if self.stats_file and os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                for key in self.stats:
+                    self.stats[key] = int(saved.get(key, 0))
+            except Exception as e:
+                print(f"⚠️ Prefilter stats loading error: {e}")
+        return self
+
+    def save_stats(self):
+        if not self.stats_file:
+            return
+        save_json_atomic(self.stats_file, self.stats, "Prefilter stats")
+
+    def precision_recall(self) -> Tuple[Optional[float], Optional[float]]:
+        """Stime dalle decisioni del modello: precision sul campione shadow, recall scalando
+        il campione sulla frazione shadow e confrontandolo con i post segnalati sotto soglia
+        che il modello ha scartato. None se non ci sono dati sufficienti."""
+        agree, disagree, missed = (self.stats["shadow_agree"], self.stats["shadow_disagree"],
+                                   self.stats["flagged_missed"])
+        precision = agree / (agree + disagree) if agree + disagree else None
+        if not self.shadow_rate or agree + missed == 0:
+            return precision, None
+        estimated_caught = agree / self.shadow_rate
+        return precision, estimated_caught / (estimated_caught + missed)
+
+    def describe(self) -> str:
+        precision, recall = self.precision_recall()
+        fmt = lambda value: f"{value:.1%}" if value is not None else "n/a"
+        return (f"Relevance prefilter ({'/'.join(self.languages)}): {self.rejected} rejected locally, "
+                f"{self.passed} sent to the model; precision {fmt(precision)}, recall {fmt(recall)} "
+                f"({self.stats['shadow_agree'] + self.stats['shadow_disagree']} shadow checks, "
+                f"{self.stats['flagged_missed']} flagged posts below threshold rejected by the model)")
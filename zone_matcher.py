@@ -0,0 +1,141 @@
+# zone_matcher.py
+# Indice delle zone/quartieri di una città e riconoscimento con Aho-Corasick
+#
+# Lo zone_mapping di una città viene normalizzato (stessa normalizzazione del testo dei
+# post), deduplicato e compilato una sola volta in un automa sulle parole: una sola
+# passata trova tutti i token presenti, sempre su confini di parola ("city" non scatta
+# dentro "velocity"). Il punteggio resta quello di infer_macro_zone: 2 per un match
+# sulla zona, 1 per un match solo su titolo/descrizione.
+
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, List, Sequence, Set, Tuple
+
+
+def normalize_zone_text(text: str) -> str:
+    if not text:
+        return ""
+    # Rimuove accenti, minuscole, normalizza spazi e apostrofi
+    text = unicodedata.normalize("NFKD", text)
+    text = text.encode("ascii", "ignore").decode("ascii")
+    text = text.lower()
+    text = text.replace("'", " ")
+    text = re.sub(r"[\W_]+", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+class ZoneMatcher:
+    """Automa multi-pattern su voci (macro_zona, token) con token già normalizzati."""
+
+    def __init__(self, entries: Sequence[Tuple[str, str]]):
+        # Voci nell'ordine del mapping: l'ordine decide i pareggi
+        self._entries = list(entries)
+        self._entries_by_token: Dict[str, List[int]] = {}
+        for index, (_, token) in enumerate(self._entries):
+            self._entries_by_token.setdefault(token, []).append(index)
+
+        # Trie sulle parole dei token, con link di fallimento e output per nodo
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for token in self._entries_by_token:
+            node = 0
+            for word in token.split():
+                next_node = self._goto[node].get(word)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][word] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append(token)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(word, 0)
+                self._output[child].extend(self._output[self._fail[child]])
+
+    def matches(self, text_norm: str) -> Set[str]:
+        """Token presenti nel testo già normalizzato, in una sola passata."""
+        found: Set[str] = set()
+        node = 0
+        for word in text_norm.split():
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+            if self._output[node]:
+                found.update(self._output[node])
+        return found
+
+    def best_macro(self, zona_norm: str, corpus_norm: str) -> Tuple[str, str]:
+        """(macro_zona, token) col punteggio più alto, ("", "") se nessun token è presente.
+        A parità vince la macro-zona che viene prima nel mapping."""
+        zone_hits = self.matches(zona_norm) if zona_norm else set()
+        corpus_hits = self.matches(corpus_norm) if corpus_norm else set()
+        hit_entries = sorted(index for token in zone_hits | corpus_hits
+                             for index in self._entries_by_token[token])
+
+        best_macro, best_token, best_score = "", "", 0
+        current_macro, score = None, 0
+        for index in hit_entries:
+            macro, token = self._entries[index]
+            if macro != current_macro:
+                current_macro, score = macro, 0
+            score += 2 if token in zone_hits else 1
+            if score > best_score:
+                best_macro, best_token, best_score = macro, token, score
+        return best_macro, best_token
+
+
+class ZoneIndex:
+    """Indice immutabile dello zone_mapping di una città: token normalizzati e deduplicati
+    per macro-zona, compilati nell'automa usato da infer_macro_zone.
+    I token che non possono mai corrispondere a un testo normalizzato vengono scartati
+    e riportati in `unmatchable`."""
+
+    def __init__(self, zone_mapping: Dict[str, List[str]]):
+        entries: List[Tuple[str, str]] = []
+        unmatchable: List[Tuple[str, str]] = []
+        duplicates = 0
+        for macro, tokens in zone_mapping.items():
+            seen: Set[str] = set()
+            for raw_token in tokens:
+                token = normalize_zone_text(raw_token)
+                # Vuoto dopo la normalizzazione, oppure solo numeri ("22@" → "22", che
+                # scatterebbe su prezzi ed età): nessun match affidabile possibile
+                if not token or token.replace(" ", "").isdigit():
+                    unmatchable.append((macro, raw_token))
+                    continue
+                if token in seen:
+                    duplicates += 1
+                    continue
+                seen.add(token)
+                entries.append((macro, token))
+
+        self.macro_zones: Tuple[str, ...] = tuple(zone_mapping)
+        self.entries: Tuple[Tuple[str, str], ...] = tuple(entries)
+        self.unmatchable: Tuple[Tuple[str, str], ...] = tuple(unmatchable)
+        self.duplicates = duplicates
+        self._matcher = ZoneMatcher(entries)
+
+    def best_macro(self, zona_norm: str, corpus_norm: str) -> Tuple[str, str]:
+        return self._matcher.best_macro(zona_norm, corpus_norm)
+
+    def describe(self) -> str:
+        tokens = len({token for _, token in self.entries})
+        text = (f"Zone index: {tokens} tokens in {len(self.macro_zones)} macro-zones, "
+                f"{self.duplicates} duplicates dropped")
+        if self.unmatchable:
+            text += ", unmatchable: " + ", ".join(f"'{token}' ({macro})" for macro, token in self.unmatchable)
+        return text
@@ -0,0 +1,68 @@
+# zone_memo.py
+# Memo persistente zona/quartiere → macro-zona imparato dal fallback AI
+#
+# Le stesse zone ("Poble Sec", "Trastevere") ricorrono in molti post e tra un run e
+# l'altro: una volta classificate dal modello vengono risolte localmente da
+# infer_macro_zone. Anche le risposte "non determinabile" vengono ricordate, ma solo
+# per `negative_ttl_hours`, così una zona sconosciuta viene richiesta di nuovo più avanti.
+
+import json
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from json_store import save_json_atomic
+
+
+class ZoneMacroMemo:
+    """Zona normalizzata → macro-zona ("" = il modello non l'ha saputa classificare)."""
+
+    def __init__(self, path: str, normalize: Callable[[str], str], negative_ttl_hours: float = 168):
+        self.path = path
+        self.normalize = normalize
+        self.negative_ttl_seconds = negative_ttl_hours * 3600
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        self.hits = 0
+        self.learned = 0
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f).get('zones', {})
+            except Exception as e:
+                print(f"⚠️ Zone memo loading error: {e}")
+                self._entries = {}
+        return self
+
+    def lookup(self, zone: str) -> Optional[str]:
+        """Macro-zona imparata, "" se la zona è nota come non classificabile, None se va chiesta al modello."""
+        entry = self._entries.get(self.normalize(zone))
+        if entry is None:
+            return None
+        if not entry['macro'] and time.time() - entry['ts'] > self.negative_ttl_seconds:
+            return None
+        self.hits += 1
+        return entry['macro']
+
+    def learn(self, zone: str, macro: str):
+        key = self.normalize(zone)
+        if not key:
+            return
+        self._entries[key] = {'macro': macro or "", 'ts': time.time()}
+        self._dirty = True
+        if macro:
+            self.learned += 1
+
+    def save(self):
+        if not self._dirty:
+            return
+        if save_json_atomic(self.path, {'zones': self._entries}, "Zone memo", indent=1, sort_keys=True):
+            self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def describe(self) -> str:
+        return f"Zone memo: {len(self._entries)} zones, {self.hits} resolved from memo, {self.learned} learned this run"